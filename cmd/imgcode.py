@@ -4,7 +4,6 @@ import hashlib
 import numpy as np
 from PIL import Image
 import os
-import random
 import argparse
 
 def generate_color_map(password):
@@ -24,26 +23,42 @@ def generate_color_map(password):
 	
 	return color_map
 
-def encode_text_to_image(text, password, img_size=(100, 100)):
-	""" Encode a text message into an image using a password. """
+DEFAULT_DECOY_MARGIN = 1.0  # filler pixels per message pixel, at least
+MIN_CANVAS_PIXELS = 64
+
+def canvas_size(message_pixels, decoy_margin=DEFAULT_DECOY_MARGIN):
+	""" Smallest near-square (width, height) holding message_pixels plus decoy_margin times as many filler pixels. """
+	total_pixels = max(MIN_CANVAS_PIXELS, message_pixels + int(np.ceil(message_pixels * decoy_margin)))
+	width = int(np.ceil(np.sqrt(total_pixels)))
+	return width, -(-total_pixels // width)
+
+def encode_text_to_image(text, password, img_size=None, decoy_margin=DEFAULT_DECOY_MARGIN):
+	""" Encode a text message into an image using a password.
+	
+	Without img_size the canvas is the smallest that fits the message plus decoy_margin times as
+	many filler pixels. The decoder reads every pixel, so it needs no size.
+	"""
 	color_map = generate_color_map(password)
 	
 	# Prepare the text
 	text = text.upper()
 	
-	# Create a list of pixel colors based on the text
-	pixels = []
-	for char in text:
-		if char.isalpha() or char == ' ':  # Encode both letters and spaces
-			pixels.append(color_map[char])
-		
-	# Fill the rest of the pixels with random colors (filler)
+	# Look up the pixel colors for the text (letters and spaces only)
+	colors = [color_map[char] for char in text if char.isalpha() or char == ' ']
+	
+	if img_size is None:
+		img_size = canvas_size(len(colors), decoy_margin)
 	grid_size = img_size[0] * img_size[1]
-	while len(pixels) < grid_size:
-		pixels.append(tuple(random.randint(0, 255) for _ in range(3)))
+	if len(colors) > grid_size:
+		raise ValueError("Message is too large for the image.")
 		
-	# Convert the list of pixels to a NumPy array and reshape it
-	pixels_array = np.array(pixels, dtype=np.uint8).reshape(img_size[1], img_size[0], 3)
+	# Draw the whole canvas as random filler in one call, then write the message over its start
+	pixels = np.random.default_rng().integers(0, 256, (grid_size, 3), dtype=np.uint8)
+	if colors:
+		pixels[:len(colors)] = colors
+		
+	# Reshape the flat pixels into the image
+	pixels_array = pixels.reshape(img_size[1], img_size[0], 3)
 	
 	# Create and save the image
 	img = Image.fromarray(pixels_array)
@@ -55,17 +70,27 @@ def decode_image_to_text(image_path, password):
 	color_map = generate_color_map(password)
 	reverse_color_map = {v: k for k, v in color_map.items()}
 	
+	# Sorted 24-bit keys of the valid colors and the character each one decodes to
+	color_keys = np.array([(r << 16) | (g << 8) | b for r, g, b in reverse_color_map], dtype=np.uint32)
+	order = np.argsort(color_keys)
+	color_keys = color_keys[order]
+	chars = np.array(list(reverse_color_map.values()))[order]
+	
 	img = Image.open(image_path)
 	img_array = np.array(img)
+	if img_array.ndim != 3 or img_array.shape[2] != 3:
+		return ''  # Only RGB pixels can match a color
+	
+	# Pack every pixel into a 24-bit key, in scan order
+	pixels = img_array.reshape(-1, 3).astype(np.uint32)
+	keys = (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
 	
 	# Extract the encoded letters from the image pixels, ignoring filler pixels
-	decoded_text = []
-	for row in img_array:
-		for pixel in row:
-			if tuple(pixel) in reverse_color_map:  # Only map valid colors
-				decoded_text.append(reverse_color_map[tuple(pixel)])
-			
-	return ''.join(decoded_text).strip()
+	slots = np.searchsorted(color_keys, keys).clip(max=len(color_keys) - 1)
+	matched = color_keys[slots] == keys
+	decoded_text = chars[slots[matched]]
+	
+	return ''.join(decoded_text.tolist()).strip()
 
 def main():
 	parser = argparse.ArgumentParser(description="Encode/Decode messages to/from an image using a password.")
@@ -74,12 +99,13 @@ def main():
 	parser.add_argument("-e", "--encode", type=str, help="Text message to encode")
 	parser.add_argument("-d", "--decode", type=str, help="Image path to decode")
 	parser.add_argument("-p", "--password", type=str, required=True, help="Password for encoding/decoding")
+	parser.add_argument("--decoy-margin", type=float, default=DEFAULT_DECOY_MARGIN, help="Filler pixels per message pixel when encoding")
 	
 	args = parser.parse_args()
 	
 	if args.encode:
 		# Encoding mode
-		encode_text_to_image(args.encode, args.password)
+		encode_text_to_image(args.encode, args.password, decoy_margin=args.decoy_margin)
 		
 	elif args.decode:
 		# Decoding mode
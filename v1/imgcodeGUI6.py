@@ -2,14 +2,24 @@
 #error when msg is too large 
 
 import hashlib
+import itertools
 import numpy as np
 from PIL import Image, ImageTk
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import scrolledtext
 from tkinter import ttk
 
+CHARACTERS = [chr(j) for j in range(256)]
+
+LEGACY_IMG_SIZE = (100, 100)
+DEFAULT_DECOY_MARGIN = 1.0  # filler pixels per message pixel, at least
+MIN_CANVAS_PIXELS = 64
+POOL_MIN_CHUNKS = 4  # a process pool only pays off for decodes of at least this many chunks
+
 def generate_color_for_char_and_index(char, index, password):
     """ Generate a unique color for each character occurrence using the password. """
     # Generate a deterministic hash using the password, character, and index
@@ -24,55 +34,107 @@ def generate_color_for_char_and_index(char, index, password):
     
     return (r, g, b)
 
-def generate_pixel_positions(img_size, password, message_length):
-    """ Generate a list of unique pixel positions in the image to encode the message. """
+def length_pixel_mask(password):
+    """ Password-keyed mask XORed with the 24-bit message length stored in the first pixel of the v1.1 layout. """
+    return hashlib.sha256(f"{password}\x00length".encode('utf-8')).digest()[:3]
+
+def encode_length_color(length, password):
+    """ Color of the v1.1 length pixel for a message of the given length. """
+    return tuple(a ^ b for a, b in zip(length_pixel_mask(password), length.to_bytes(3, 'big')))
+
+def decode_length_color(color, password):
+    """ Recover the message length from a v1.1 length pixel given as 3 RGB bytes. """
+    return int.from_bytes(bytes(a ^ b for a, b in zip(length_pixel_mask(password), color)), 'big')
+
+def generate_pixel_positions(img_size, password, message_length, rng=None):
+    """ Generate a list of unique pixel positions in the image to encode the message.
+    
+    The shuffle uses rng (a private random.Random when None) rather than the global random module,
+    so concurrent calls cannot disturb each other. rng is left positioned just after the shuffle.
+    """
     total_pixels = img_size[0] * img_size[1]
     
     # Use the password to generate a deterministic random sequence of pixel indices
     hash_object = hashlib.sha256(password.encode())
     password_hash = hash_object.digest()
     
-    random.seed(password_hash)  # Set the seed for reproducibility
+    if rng is None:
+        rng = random.Random()
+    rng.seed(password_hash)  # Set the seed for reproducibility
     
     # Generate a list of all possible pixel positions (flat index)
     all_positions = list(range(total_pixels))
     
     # Shuffle these positions in a deterministic way
-    random.shuffle(all_positions)
+    rng.shuffle(all_positions)
     
     # Return only as many positions as needed for the message
     return all_positions[:message_length]
 
-def encode_text_to_image(text, password, img_size=(100, 100), debug=False):
-    """ Encode a text message into an image using a password, ensuring repeated letters get unique colors. """
+def canvas_size(message_pixels, decoy_margin=DEFAULT_DECOY_MARGIN):
+    """ Smallest near-square (width, height) holding message_pixels plus decoy_margin times as many filler pixels. """
+    total_pixels = max(MIN_CANVAS_PIXELS, message_pixels + int(np.ceil(message_pixels * decoy_margin)))
+    width = int(np.ceil(np.sqrt(total_pixels)))
+    return width, -(-total_pixels // width)
+
+def draw_filler_bytes(rng, count):
+    """ Draw count values in bulk, identical to count successive rng.randint(0, 255) calls.
+    
+    randint(0, 255) takes the top 9 bits of one Mersenne Twister word and retries while they
+    exceed 255, so filtering a block of raw words the same way reproduces its output exactly.
+    """
+    values = np.empty(0, dtype=np.uint8)
+    while len(values) < count:
+        words = 2 * (count - len(values)) + 64
+        samples = np.frombuffer(rng.getrandbits(32 * words).to_bytes(4 * words, 'little'), dtype='<u4') >> 23
+        values = np.concatenate([values, samples[samples < 256].astype(np.uint8)])
+    return values[:count]
+
+def encode_text_to_image(text, password, img_size=None, debug=False, legacy=False, decoy_margin=DEFAULT_DECOY_MARGIN):
+    """ Encode a text message into an image using a password, ensuring repeated letters get unique colors.
+    
+    By default the v1.1 layout is written: the first shuffled pixel holds the message length and
+    the characters follow it, so decoding can stop at the end of the message. legacy=True writes
+    the original layout, with no length pixel, exactly as before. The decoder only recognises
+    characters up to U+00FF, so v1.1 rejects anything above that with ValueError.
+    Without img_size the canvas is the smallest that holds the message plus decoy_margin times as
+    many filler pixels (legacy images keep the old 100x100); decoders read the size from the image.
+    """
     message_length = len(text)
-    
-    # Generate pixel positions using the password and image size
-    pixel_positions = generate_pixel_positions(img_size, password, message_length)
-    
-    # Create a list to hold the pixel colors
-    pixels = [None] * (img_size[0] * img_size[1])  # Initialize all pixels as None
-    
-    # Place the encoded characters at the chosen pixel positions
-    for i, char in enumerate(text):
-        # Generate a unique color for each character occurrence
-        color = generate_color_for_char_and_index(char, i, password)
-        
-        # Get the pixel position
-        pos = pixel_positions[i]
-        row = pos // img_size[0]
-        col = pos % img_size[0]
-        
-        # Assign the unique color to this position
-        pixels[pos] = color
+    header_length = 0 if legacy else 1
+    if img_size is None:
+        img_size = LEGACY_IMG_SIZE if legacy else canvas_size(message_length + header_length, decoy_margin)
+    if message_length + header_length > img_size[0] * img_size[1] or (not legacy and message_length >= 1 << 24):
+        raise ValueError("Message is too large for the image.")
+    if not legacy and any(ord(char) >= len(CHARACTERS) for char in text):
+        raise ValueError("Only characters up to U+00FF can be encoded.")
+    
+    # Generate pixel positions using the password and image size; the filler below continues
+    # from the same generator, exactly as it used to continue from the global seed
+    rng = random.Random()
+    pixel_positions = generate_pixel_positions(img_size, password, message_length + header_length, rng)
+    
+    # Start from a flat array of pixels and a mask of those not used for encoding
+    total_pixels = img_size[0] * img_size[1]
+    pixels = np.zeros((total_pixels, 3), dtype=np.uint8)
+    filler = np.ones(total_pixels, dtype=bool)
+    filler[pixel_positions] = False
+    
+    # The v1.1 length pixel comes first
+    if not legacy:
+        pixels[pixel_positions[0]] = encode_length_color(message_length, password)
+    
+    # Place a unique color for each character occurrence at the chosen pixel positions
+    if text:
+        colors = [generate_color_for_char_and_index(char, i, password) for i, char in enumerate(text)]
+        pixels[pixel_positions[header_length:]] = colors
         
-    # Fill in any remaining positions with random colors (or black if in debug mode)
-    for i in range(len(pixels)):
-        if pixels[i] is None:  # If the pixel is still None (not used for encoding)
-            pixels[i] = (0, 0, 0) if debug else tuple(random.randint(0, 255) for _ in range(3))
+    # Fill in any remaining positions with random colors (or leave them black in debug mode)
+    if not debug:
+        pixels[filler] = draw_filler_bytes(rng, int(filler.sum()) * 3).reshape(-1, 3)
     
-    # Convert the list of pixels to a NumPy array and reshape it
-    pixels_array = np.array(pixels, dtype=np.uint8).reshape(img_size[1], img_size[0], 3)
+    # Reshape the flat pixels into the image
+    pixels_array = pixels.reshape(img_size[1], img_size[0], 3)
     
     # Create and save the image
     img_path = "encoded_message.png"
@@ -81,35 +143,117 @@ def encode_text_to_image(text, password, img_size=(100, 100), debug=False):
     
     return img_path, img
 
-def decode_image_to_text(image_path, password, img_size=(100, 100)):
-    """ Decode the image back into the original text using a password. """
-    # Generate the pixel positions used during encoding
-    total_pixels = img_size[0] * img_size[1]
-    pixel_positions = generate_pixel_positions(img_size, password, total_pixels)
+def build_reverse_lookup(index, password, password_hash=None, char_bytes=None):
+    """ Map every color a character can take at this index, as 3 RGB bytes, back to the character.
+    
+    Where two characters collide on one color the lowest code point wins, as in a linear search.
+    """
+    # Hash the password prefix once and extend a copy of it for each character
+    if password_hash is None:
+        password_hash = hashlib.sha256(password.encode('utf-8'))
+    if char_bytes is None:
+        char_bytes = [chr(j).encode('utf-8') for j in range(256)]
+    index_bytes = str(index).encode('utf-8')
+    copy = password_hash.copy
+    
+    lookup = {}
+    for j in range(255, -1, -1):
+        hash_object = copy()
+        hash_object.update(char_bytes[j] + index_bytes)
+        lookup[hash_object.digest()[:3]] = CHARACTERS[j]
+    return lookup
+
+def decode_color_keys(password, start, keys):
+    """ Decode a run of pixel colors (3 RGB bytes each) found at indices start, start + 1, ... (None where nothing matches). """
+    password_hash = hashlib.sha256(password.encode('utf-8'))
+    char_bytes = [chr(j).encode('utf-8') for j in range(256)]
+    return [build_reverse_lookup(start + offset, password, password_hash, char_bytes).get(key)
+            for offset, key in enumerate(keys)]
+
+def iter_decoded_chars(password, keys, executor=None, chunk_size=500):
+    """ Yield the character (or None) for each pixel color in keys, the i-th taken as character index i.
+    
+    With an executor the per-index lookups are spread over its processes, a chunk of indices at a
+    time, but only when there are at least POOL_MIN_CHUNKS chunks; shorter runs are cheaper inline.
+    """
+    starts = range(0, len(keys), chunk_size)
+    if executor is None or len(starts) < POOL_MIN_CHUNKS:
+        for start in starts:
+            yield from decode_color_keys(password, start, keys[start:start + chunk_size])
+        return
+    for chunk in executor.map(decode_color_keys, itertools.repeat(password), starts,
+                              (keys[start:start + chunk_size] for start in starts)):
+        yield from chunk
+
+def decode_image_to_text(image_path, password, img_size=None, workers=None, stop_at_message_end=False, chunk_size=500):
+    """ Decode the image back into the original text using a password.
+    
+    A v1.1 image is recognised by its length pixel and only that many characters are read, each
+    of which must decode; anything else falls back to the legacy decoder.
+    workers spreads long runs of per-index lookups over a pool of that many processes, created at
+    most once per call and only when a run is long enough to need it. By default the legacy
+    decoder checks every position, exactly as before; with stop_at_message_end it stops at the
+    first position that holds no character, which skips the filler but also ignores any filler
+    pixel that happens to match a character after the message.
+    img_size defaults to the size of the image itself.
+    """
+    executor = None
+    
+    def pool_for(keys):
+        # Start the pool on first need and reuse it for the legacy fallback
+        nonlocal executor
+        if workers is None or len(keys) < POOL_MIN_CHUNKS * chunk_size:
+            return None
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        return executor
     
     try:
         # Open the image correctly with PIL
         img = Image.open(image_path)
         img_array = np.array(img)
+        if img_size is None:
+            img_size = img.size
         
-        # Map pixel colors to their corresponding characters
+        # Generate the pixel positions used during encoding
+        total_pixels = img_size[0] * img_size[1]
+        pixel_positions = generate_pixel_positions(img_size, password, total_pixels)
+        
+        # Read the pixel at each shuffled position as 3 RGB bytes (None never matches)
+        positions = np.array(pixel_positions)
+        rows = positions // img_size[0]
+        cols = positions % img_size[0]
+        pixels = img_array[rows, cols]
+        if pixels.ndim == 2 and pixels.shape[1] == 3 and pixels.dtype == np.uint8:
+            packed = pixels.tobytes()
+            keys = [packed[k:k + 3] for k in range(0, len(packed), 3)]
+        else:
+            keys = [None] * len(positions)
+        
+        # v1.1: the length pixel says how many characters follow, and all of them must decode
+        if keys and keys[0] is not None:
+            message_length = decode_length_color(keys[0], password)
+            if message_length < len(keys):
+                decoded_text = []
+                message_keys = keys[1:message_length + 1]
+                chars = iter_decoded_chars(password, message_keys, pool_for(message_keys), chunk_size)
+                for char in chars:
+                    if char is None:
+                        chars.close()  # Cancels any chunks still queued on the pool
+                        break
+                    decoded_text.append(char)
+                else:
+                    return ''.join(decoded_text)
+        
+        # Legacy: map pixel colors to their corresponding characters
         decoded_text = []
-        for i, pos in enumerate(pixel_positions):
-            row = pos // img_size[0]
-            col = pos % img_size[0]
-            pixel_tuple = tuple(img_array[row, col])
-            
-            # Try to map the pixel color back to the original character
-            char = None
-            for j in range(256):
-                # Try to reconstruct the original character and index
-                possible_color = generate_color_for_char_and_index(chr(j), i, password)
-                if pixel_tuple == possible_color:
-                    char = chr(j)
-                    break
-                
-            if char:
+        chars = iter_decoded_chars(password, keys, pool_for(keys), chunk_size)
+        for char in chars:
+            if char is not None:
                 decoded_text.append(char)
+            elif stop_at_message_end:
+                chars.close()
+                break
                 
         return ''.join(decoded_text).strip()
     
@@ -117,6 +261,10 @@ def decode_image_to_text(image_path, password, img_size=(100, 100)):
         print(f"Error decoding image: {e}")
         return ""
     
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    
 def encode_action():
     """ Handle encoding action from the GUI. """
     text = text_entry.get()
@@ -126,19 +274,14 @@ def encode_action():
         messagebox.showerror("Error", "Please provide both message and password.")
         return
     
-    # Calculate the number of available pixels in the image
-    img_size = (100, 100)  # Default image size, can be changed if necessary
-    total_pixels = img_size[0] * img_size[1]
-    
-    # Check if the message is too long for the image
-    if len(text) > total_pixels:
-        messagebox.showerror("Error", "Message is too large for the image. Please shorten it.")
-        return
-    
     debug_mode = debug_var.get()  # Check if debug checkbox is enabled
     
-    # Encode the message
-    file_path, img = encode_text_to_image(text, password, debug=debug_mode)
+    # Encode the message; the canvas is sized to fit it
+    try:
+        file_path, img = encode_text_to_image(text, password, debug=debug_mode)
+    except ValueError as e:
+        messagebox.showerror("Error", str(e))
+        return
     messagebox.showinfo("Success", f"Message encoded and saved as {file_path}")
     
     # Display the image in the GUI (encode tab)
@@ -201,7 +344,7 @@ def decode_action():
     
     # Start the decoding process in a separate thread to avoid freezing the UI
     def decode_in_thread():
-        decoded_text = decode_image_to_text(selected_image_path, password)
+        decoded_text = decode_image_to_text(selected_image_path, password, workers=os.cpu_count())
         
         # Hide the loading animation and display the decoded message
         loading_label.grid_forget()
@@ -211,74 +354,75 @@ def decode_action():
     # Run the decoding in a separate thread to prevent blocking the UI
     root.after(100, decode_in_thread)
     
-# Set up the main window
-root = tk.Tk()
-root.title("Message Encoder/Decoder")
+if __name__ == "__main__":
+    # Set up the main window
+    root = tk.Tk()
+    root.title("Message Encoder/Decoder")
 
-# Create Notebook (tabs)
-notebook = ttk.Notebook(root)
-notebook.grid(row=0, column=0, padx=10, pady=10)
+    # Create Notebook (tabs)
+    notebook = ttk.Notebook(root)
+    notebook.grid(row=0, column=0, padx=10, pady=10)
 
-# Encoding Tab
-encode_tab = ttk.Frame(notebook)
-notebook.add(encode_tab, text="Encode")
+    # Encoding Tab
+    encode_tab = ttk.Frame(notebook)
+    notebook.add(encode_tab, text="Encode")
 
-text_label = tk.Label(encode_tab, text="Message to Encode:")
-text_label.grid(row=0, column=0, padx=10, pady=5)
+    text_label = tk.Label(encode_tab, text="Message to Encode:")
+    text_label.grid(row=0, column=0, padx=10, pady=5)
 
-text_entry = tk.Entry(encode_tab, width=50)
-text_entry.grid(row=0, column=1, padx=10, pady=5)
+    text_entry = tk.Entry(encode_tab, width=50)
+    text_entry.grid(row=0, column=1, padx=10, pady=5)
 
-encode_password_label = tk.Label(encode_tab, text="Password:")
-encode_password_label.grid(row=1, column=0, padx=10, pady=5)
+    encode_password_label = tk.Label(encode_tab, text="Password:")
+    encode_password_label.grid(row=1, column=0, padx=10, pady=5)
 
-encode_password_entry = tk.Entry(encode_tab, width=50, show="*")
-encode_password_entry.grid(row=1, column=1, padx=10, pady=5)
+    encode_password_entry = tk.Entry(encode_tab, width=50, show="*")
+    encode_password_entry.grid(row=1, column=1, padx=10, pady=5)
 
-debug_var = tk.BooleanVar()  # Variable to hold the debug mode state
-debug_checkbox = tk.Checkbutton(encode_tab, text="Debug Mode", variable=debug_var)
-debug_checkbox.grid(row=2, column=0, columnspan=2, pady=5)
+    debug_var = tk.BooleanVar()  # Variable to hold the debug mode state
+    debug_checkbox = tk.Checkbutton(encode_tab, text="Debug Mode", variable=debug_var)
+    debug_checkbox.grid(row=2, column=0, columnspan=2, pady=5)
 
-encode_button = tk.Button(encode_tab, text="Encode", command=encode_action)
-encode_button.grid(row=3, column=0, columnspan=2, pady=10)
+    encode_button = tk.Button(encode_tab, text="Encode", command=encode_action)
+    encode_button.grid(row=3, column=0, columnspan=2, pady=10)
 
-# Image display area for encoding
-image_label = tk.Label(encode_tab)
-image_label.grid(row=4, column=0, columnspan=2, pady=10)
+    # Image display area for encoding
+    image_label = tk.Label(encode_tab)
+    image_label.grid(row=4, column=0, columnspan=2, pady=10)
 
-# Decoding Tab
-decode_tab = ttk.Frame(notebook)
-notebook.add(decode_tab, text="Decode")
+    # Decoding Tab
+    decode_tab = ttk.Frame(notebook)
+    notebook.add(decode_tab, text="Decode")
 
-choose_file_button = tk.Button(decode_tab, text="Choose File", command=choose_file_action)
-choose_file_button.grid(row=0, column=0, padx=10, pady=5)
+    choose_file_button = tk.Button(decode_tab, text="Choose File", command=choose_file_action)
+    choose_file_button.grid(row=0, column=0, padx=10, pady=5)
 
-file_path_label = tk.Label(decode_tab, text="Selected Image: None")
-file_path_label.grid(row=0, column=1, padx=10, pady=5)
+    file_path_label = tk.Label(decode_tab, text="Selected Image: None")
+    file_path_label.grid(row=0, column=1, padx=10, pady=5)
 
-decode_password_label = tk.Label(decode_tab, text="Password for Decoding:")
-decode_password_label.grid(row=1, column=0, padx=10, pady=5)
+    decode_password_label = tk.Label(decode_tab, text="Password for Decoding:")
+    decode_password_label.grid(row=1, column=0, padx=10, pady=5)
 
-decode_password_entry = tk.Entry(decode_tab, width=50, show="*")
-decode_password_entry.grid(row=1, column=1, padx=10, pady=5)
+    decode_password_entry = tk.Entry(decode_tab, width=50, show="*")
+    decode_password_entry.grid(row=1, column=1, padx=10, pady=5)
 
-decode_button = tk.Button(decode_tab, text="Decode", command=decode_action)
-decode_button.grid(row=2, column=0, columnspan=2, pady=10)
+    decode_button = tk.Button(decode_tab, text="Decode", command=decode_action)
+    decode_button.grid(row=2, column=0, columnspan=2, pady=10)
 
-# Image display area for decoding
-decode_image_label = tk.Label(decode_tab)
-decode_image_label.grid(row=3, column=0, columnspan=2, pady=10)
+    # Image display area for decoding
+    decode_image_label = tk.Label(decode_tab)
+    decode_image_label.grid(row=3, column=0, columnspan=2, pady=10)
 
-output_label = tk.Label(decode_tab, text="Decoded Message:")
-output_label.grid(row=4, column=0, padx=10, pady=5)
+    output_label = tk.Label(decode_tab, text="Decoded Message:")
+    output_label.grid(row=4, column=0, padx=10, pady=5)
 
-output_text = scrolledtext.ScrolledText(decode_tab, width=50, height=10)
-output_text.grid(row=5, column=0, columnspan=2, padx=10, pady=5)
+    output_text = scrolledtext.ScrolledText(decode_tab, width=50, height=10)
+    output_text.grid(row=5, column=0, columnspan=2, padx=10, pady=5)
 
-selected_image_path = None
+    selected_image_path = None
 
-# Loading label for the decoding process
-loading_label = tk.Label(decode_tab, text="Decoding...")
-loading_label.grid_forget()  # Initially hidden
+    # Loading label for the decoding process
+    loading_label = tk.Label(decode_tab, text="Decoding...")
+    loading_label.grid_forget()  # Initially hidden
 
-root.mainloop()
+    root.mainloop()
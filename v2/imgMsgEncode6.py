@@ -1,8 +1,30 @@
 #!/usr/bin/env python3
 import hashlib
+import argparse
+import base64
+import bz2
+import io
+import hmac
+import itertools
+import json
+import lzma
 import numpy as np
 from PIL import Image, ImageTk
+import os
 import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import scrolledtext
@@ -15,49 +37,1401 @@ def generate_color_for_char_and_index(char, index, password):
     hash_digest = hash_object.digest()
     return hash_digest[0] % 2, hash_digest[1] % 2, hash_digest[2] % 2
 
-def encode_text_to_image(text, password, img_path, debug=False):
-    """Encode text into an existing image's LSBs while preserving transparency if present."""
+# Pixel selection layouts. LAYOUT_LEGACY images carry a bare 32-bit length header and
+# use the full password-seeded shuffle; every newer layout starts with a versioned header.
+LAYOUT_LEGACY = 0
+LAYOUT_LAZY = 1
+LAYOUT_FEISTEL = 2
+LAYOUT_TILED = 3
+VERSIONED_LAYOUTS = (LAYOUT_FEISTEL, LAYOUT_TILED, LAYOUT_LAZY)
+
+FEISTEL_ROUNDS = 6
+
+HEADER_MAGIC = b"SC"
+HEADER_VERSION = 3
+HEADER_FORMAT = ">2sBBHI8s"  # magic, version, layout, flags, payload length in bytes, MAC
+HEADER_MAC_SIZE = 8
+HEADER_BITS = struct.calcsize(HEADER_FORMAT) * 8
+
+# Header flags. The low three bits record how many channels of each selected body pixel
+# carry payload bits: 1 spreads one bit per pixel over R, G, B in turn, 3 packs R, G and B
+# and 4 packs R, G, B and A. The header itself always uses one bit per pixel.
+# Bits three and four hold the number of low bits replaced in each body channel, minus one.
+FLAG_CHANNELS_MASK = 0x0007
+FLAG_DEPTH_SHIFT = 3
+FLAG_DEPTH_MASK = 0x0018
+SUPPORTED_CHANNELS = (1, 3, 4)
+SUPPORTED_DEPTHS = (1, 2, 3, 4)
+
+# Bits five to seven name the codec the payload was compressed with, and FLAG_TEXT marks
+# payloads that were UTF-8 encoded from a string rather than passed in as bytes.
+FLAG_CODEC_SHIFT = 5
+FLAG_CODEC_MASK = 0x00E0
+FLAG_TEXT = 0x0100
+
+# Bits nine to thirteen hold log2 of the stripe height used by LAYOUT_TILED.
+# FLAG_FRONT_LOADED fills stripes in order instead of spreading the body over all of them, so
+# a short payload stays within the first stripe and a progressive decoder can stop early.
+FLAG_TILE_SHIFT = 9
+FLAG_TILE_MASK = 0x3E00
+FLAG_FRONT_LOADED = 0x4000
+DEFAULT_TILE_ROWS = 256
+
+CODEC_IDS = {"none": 0, "zlib": 1, "lzma": 2, "bz2": 3, "zstd": 4}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+CARRIER_EXTENSIONS = (".png", ".bmp", ".tif", ".tiff", ".ppm", ".pgm", ".webp")
+
+# Gathers and scatters touching at least this many channel values are applied in ascending
+# memory order; None disables the sort. Whether the sort pays for itself depends on the
+# machine's cache and TLB sizes, so measure with benchmark_scatter() before enabling it.
+SORTED_SCATTER_MIN_TARGETS = None
+
+def _zstd_compress(data):
+    if zstandard is None:
+        raise ValueError("The zstd codec requires the zstandard package.")
+    return zstandard.ZstdCompressor(level=10).compress(data)
+
+def _zstd_decompress(data):
+    if zstandard is None:
+        raise ValueError("The zstd codec requires the zstandard package.")
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+# Exceptions the decompressors raise on a corrupted body, reported as ValueError
+DECOMPRESS_ERRORS = (zlib.error, lzma.LZMAError, OSError, ValueError)
+if zstandard is not None:
+    DECOMPRESS_ERRORS += (zstandard.ZstdError,)
+
+CODECS = {
+    0: (lambda data: data, lambda data: data),
+    1: (lambda data: zlib.compress(data, 9), zlib.decompress),
+    2: (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+    3: (lambda data: bz2.compress(data, 9), bz2.decompress),
+    4: (_zstd_compress, _zstd_decompress),
+}
+
+def _zstd_compressobj():
+    if zstandard is None:
+        raise ValueError("The zstd codec requires the zstandard package.")
+    return zstandard.ZstdCompressor(level=10).compressobj()
+
+def _zstd_decompressobj():
+    if zstandard is None:
+        raise ValueError("The zstd codec requires the zstandard package.")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+# Incremental (compressor, decompressor) factories used by the streaming API
+STREAM_CODECS = {
+    1: (lambda: zlib.compressobj(9), zlib.decompressobj),
+    2: (lambda: lzma.LZMACompressor(preset=6), lzma.LZMADecompressor),
+    3: (lambda: bz2.BZ2Compressor(9), bz2.BZ2Decompressor),
+    4: (_zstd_compressobj, _zstd_decompressobj),
+}
+
+PayloadHeader = namedtuple("PayloadHeader", ["layout", "flags", "length"])
+EncodeResult = namedtuple("EncodeResult", ["index", "out_path", "error"])
+SharedCarrier = namedtuple("SharedCarrier", ["name", "shape", "dtype"])
+
+def format_flags(channels_per_pixel, lsb_depth):
+    """Combine the body packing options into header flags."""
+    return channels_per_pixel | (lsb_depth - 1) << FLAG_DEPTH_SHIFT
+
+def parse_flags(flags):
+    """Split header flags into (channels_per_pixel, lsb_depth)."""
+    return flags & FLAG_CHANNELS_MASK or 1, ((flags & FLAG_DEPTH_MASK) >> FLAG_DEPTH_SHIFT) + 1
+
+def encode_message(message, codec="none"):
+    """Turn a str or bytes message into stored bytes plus the codec and text header flags.
+    
+    Strings are encoded as UTF-8 and the result is compressed with the named codec.
+    """
+    if codec not in CODEC_IDS:
+        raise ValueError(f"Unknown codec: {codec}")
+    flags = CODEC_IDS[codec] << FLAG_CODEC_SHIFT
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+        flags |= FLAG_TEXT
+    return CODECS[CODEC_IDS[codec]][0](bytes(message)), flags
+
+def decode_message(data, flags):
+    """Reverse encode_message, returning str for text payloads and bytes otherwise."""
+    codec_id = (flags & FLAG_CODEC_MASK) >> FLAG_CODEC_SHIFT
+    if codec_id not in CODECS:
+        raise ValueError(f"Unknown codec id in header: {codec_id}")
+    try:
+        data = CODECS[codec_id][1](data)
+    except DECOMPRESS_ERRORS as e:
+        raise ValueError(f"Payload could not be decompressed: {e}") from e
+    return data.decode('utf-8') if flags & FLAG_TEXT else data
+
+def header_mac(fields, password):
+    """Keyed MAC over the packed header fields, truncated to HEADER_MAC_SIZE bytes."""
+    key = hashlib.sha256(b"steganocrypt-header:" + password.encode()).digest()
+    return hmac.new(key, fields, hashlib.sha256).digest()[:HEADER_MAC_SIZE]
+
+def pack_header(layout, flags, length, password):
+    """Serialize a versioned payload header authenticated with password."""
+    fields = struct.pack(HEADER_FORMAT[:-2], HEADER_MAGIC, HEADER_VERSION, layout, flags, length)
+    return fields + header_mac(fields, password)
+
+def unpack_header(data, password):
+    """Parse a versioned payload header, returning None unless its magic, version and MAC all match."""
+    magic, version, layout, flags, length, mac = struct.unpack(HEADER_FORMAT, data)
+    if magic != HEADER_MAGIC or version != HEADER_VERSION:
+        return None
+    if not hmac.compare_digest(mac, header_mac(data[:-HEADER_MAC_SIZE], password)):
+        return None
+    return PayloadHeader(layout, flags, length)
+
+def describe_header(header):
+    """Summarize a payload header as a plain dict."""
+    channels_per_pixel, lsb_depth = parse_flags(header.flags)
+    codec_id = (header.flags & FLAG_CODEC_MASK) >> FLAG_CODEC_SHIFT
+    info = {
+        "layout": header.layout,
+        "length": header.length,
+        "channels_per_pixel": channels_per_pixel,
+        "lsb_depth": lsb_depth,
+        "codec": CODEC_NAMES.get(codec_id, codec_id),
+        "text": bool(header.flags & FLAG_TEXT),
+    }
+    if header.layout == LAYOUT_TILED:
+        info["tile_rows"] = 1 << ((header.flags & FLAG_TILE_MASK) >> FLAG_TILE_SHIFT)
+        info["front_loaded"] = bool(header.flags & FLAG_FRONT_LOADED)
+    return info
+
+class PermutationCache:
+    """Bounded LRU cache of pixel permutations keyed by password digest, image size and layout.
+    
+    Keys hold a SHA-256 digest of the password, never the password itself. With compact=True
+    permutations are stored as uint32 arrays (uint64 for images past 2**32 pixels) rather than
+    Python lists, which cuts their footprint by roughly a factor of nine.
+    """
+    
+    LIST_ENTRY_BYTES = 36  # list slot plus a small int object
+    
+    def __init__(self, max_bytes=256 * 1024 * 1024, compact=True):
+        self.max_bytes = max_bytes
+        self.compact = compact
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(password, img_size, layout):
+        """Build a cache key that does not contain the plaintext password."""
+        digest = hashlib.sha256(b"steganocrypt-cache:" + password.encode()).digest()
+        return digest, img_size[0], img_size[1], layout
+    
+    def _entry_bytes(self, positions):
+        if isinstance(positions, np.ndarray):
+            return positions.nbytes
+        return len(positions) * self.LIST_ENTRY_BYTES
+    
+    def get(self, password, img_size, layout, message_length):
+        """Return a cached permutation prefix covering message_length positions, or None."""
+        key = self.make_key(password, img_size, layout)
+        with self._lock:
+            positions = self._entries.get(key)
+            if positions is None or len(positions) < min(message_length, img_size[0] * img_size[1]):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return positions
+    
+    def put(self, password, img_size, layout, positions):
+        """Store a permutation prefix, evicting least recently used entries to stay within max_bytes.
+        
+        A prefix no longer than the one already cached only refreshes that entry's recency.
+        """
+        key = self.make_key(password, img_size, layout)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and len(cached) >= len(positions):
+                self._entries.move_to_end(key)
+                return
+        if self.compact:
+            dtype = np.uint32 if img_size[0] * img_size[1] <= 2 ** 32 else np.uint64
+            positions = np.asarray(positions, dtype=dtype)
+        elif isinstance(positions, np.ndarray):
+            positions = positions.tolist()
+        size = self._entry_bytes(positions)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entry_bytes(self._entries.pop(key))
+            while self._entries and self._size + size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._entry_bytes(evicted)
+            self._entries[key] = positions
+            self._size += size
+    
+    def clear(self):
+        """Drop every cached permutation and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+    
+    def stats(self):
+        """Return hit/miss counters and current memory use."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "bytes": self._size, "max_bytes": self.max_bytes}
+
+permutation_cache = PermutationCache()
+
+def payload_to_bits(data):
+    """Unpack a bytes payload into a flat uint8 array of bits, most significant bit first."""
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+def bit_targets(pixels, positions, start=0, channels_per_pixel=1, count=None):
+    """Map flat pixel positions for payload slots start, start+1, ... to flat offsets into pixels.
+    
+    With one channel per pixel the channel cycles through R, G, B with the slot index, as in the
+    legacy layout. Otherwise every position contributes channels_per_pixel consecutive slots.
+    count truncates the targets to the number of slots actually stored.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if channels_per_pixel == 1:
+        channels = (np.arange(len(positions)) + start) % 3
+    else:
+        positions = np.repeat(positions, channels_per_pixel)
+        channels = np.tile(np.arange(channels_per_pixel), len(positions) // channels_per_pixel)
+    if count is not None:
+        positions, channels = positions[:count], channels[:count]
+    return positions * pixels.shape[2] + channels
+
+def _element_index(pixels, offsets):
+    """Return (array, index) addressing flat element offsets: a raveled view when possible."""
+    if isinstance(pixels, (MappedCarrier, CopyOnWriteCarrier)):
+        return pixels.buffer, pixels.byte_offsets(offsets)
+    if pixels.flags.c_contiguous:
+        return pixels.reshape(-1), offsets
+    return pixels, np.unravel_index(offsets, pixels.shape)
+
+def memory_order(offsets):
+    """Permutation that visits flat offsets in ascending memory order.
+    
+    Offsets and their indices are packed into one int64 key when they fit, since a plain sort is
+    several times cheaper than an argsort.
+    """
+    index_bits = max(1, (len(offsets) - 1).bit_length())
+    if len(offsets) and int(offsets.max()) < 1 << (63 - index_bits):
+        keys = np.sort(offsets << index_bits | np.arange(len(offsets), dtype=np.int64))
+        return keys & ((1 << index_bits) - 1)
+    return np.argsort(offsets, kind='stable')
+
+def _sort_targets(count, sort_targets):
+    if sort_targets is not None:
+        return sort_targets
+    return SORTED_SCATTER_MIN_TARGETS is not None and count >= SORTED_SCATTER_MIN_TARGETS
+
+def bits_to_symbols(bits, lsb_depth):
+    """Group bits into lsb_depth-bit values, most significant first, zero-padding the last group."""
+    if lsb_depth == 1:
+        return bits
+    padded = np.zeros(-(-len(bits) // lsb_depth) * lsb_depth, dtype=np.uint8)
+    padded[:len(bits)] = bits
+    return (padded.reshape(-1, lsb_depth) << np.arange(lsb_depth - 1, -1, -1, dtype=np.uint8)).sum(axis=1, dtype=np.uint8)
+
+def symbols_to_bits(symbols, lsb_depth, count=None):
+    """Expand lsb_depth-bit values back into a flat bit array, most significant first."""
+    if lsb_depth > 1:
+        symbols = (symbols[:, None] >> np.arange(lsb_depth - 1, -1, -1, dtype=np.uint8)).ravel() & 0x01
+    return symbols if count is None else symbols[:count]
+
+def embed_bits(pixels, positions, bits, start=0, channels_per_pixel=1, lsb_depth=1, sort_targets=None):
+    """Write bits into the low lsb_depth bits of the given flat pixel positions with one fancy-indexed assignment.
+    
+    With sort_targets (by default, past SORTED_SCATTER_MIN_TARGETS) the writes are applied in
+    memory order; the logical bit order is unchanged.
+    """
+    symbols = bits_to_symbols(bits, lsb_depth)
+    offsets = bit_targets(pixels, positions, start, channels_per_pixel, len(symbols))
+    if _sort_targets(len(offsets), sort_targets):
+        order = memory_order(offsets)
+        offsets, symbols = offsets[order], symbols[order]
+    target, index = _element_index(pixels, offsets)
+    target[index] = (target[index] & (0xFF ^ ((1 << lsb_depth) - 1))) | symbols
+
+def extract_bits(pixels, positions, start=0, channels_per_pixel=1, count=None, lsb_depth=1, sort_targets=None):
+    """Read count bits from the low lsb_depth bits at the given flat pixel positions with one indexed gather."""
+    slots = None if count is None else -(-count // lsb_depth)
+    offsets = bit_targets(pixels, positions, start, channels_per_pixel, slots)
+    if _sort_targets(len(offsets), sort_targets):
+        order = memory_order(offsets)
+        source, index = _element_index(pixels, offsets[order])
+        symbols = np.empty(len(offsets), dtype=pixels.dtype)
+        symbols[order] = source[index]
+    else:
+        source, index = _element_index(pixels, offsets)
+        symbols = source[index]
+    return symbols_to_bits(symbols & ((1 << lsb_depth) - 1), lsb_depth, count)
+
+def body_pixel_count(bit_count, channels_per_pixel, lsb_depth=1):
+    """Number of selected pixels needed to hold bit_count body bits."""
+    return -(-bit_count // (channels_per_pixel * lsb_depth))
+
+def capacity_report(img_path):
+    """Report the largest message, in bytes, the image can hold for each layout option.
+    
+    Keys are (channels_per_pixel, lsb_depth) for the versioned layouts plus "legacy". Only the
+    image header is read.
+    """
+    img = Image.open(img_path)
+    total_pixels = img.size[0] * img.size[1]
+    channel_options = SUPPORTED_CHANNELS if img.mode == "RGBA" else SUPPORTED_CHANNELS[:-1]
+    report = {"legacy": max(0, (total_pixels - 32) // 8)}
+    for channels_per_pixel in channel_options:
+        for lsb_depth in SUPPORTED_DEPTHS:
+            report[channels_per_pixel, lsb_depth] = max(0, (total_pixels - HEADER_BITS) * channels_per_pixel * lsb_depth // 8)
+    return report
+
+def embed_payload(pixels, password, message, layout=LAYOUT_FEISTEL, channels_per_pixel=1, lsb_depth=1, flags=0, tile_rows=DEFAULT_TILE_ROWS):
+    """Embed message bytes behind the layout's header, returning the per-bit positions and bits for logging.
+    
+    flags carries the codec and text bits for the header; the packing bits are added here.
+    For LAYOUT_TILED only the header positions and bits are returned.
+    """
+    img_size = pixels.shape[0], pixels.shape[1]
+    if layout == LAYOUT_LEGACY:
+        if channels_per_pixel != 1 or lsb_depth != 1:
+            raise ValueError("The legacy layout stores one bit per pixel.")
+        bits = payload_to_bits(len(message).to_bytes(4, 'big') + message)
+        positions = layout_pixel_positions(layout, img_size, password, len(bits))
+        if len(positions) < len(bits):
+            raise ValueError("Message is too large for the image.")
+        embed_bits(pixels, positions, bits)
+        return positions, bits
+    if channels_per_pixel not in SUPPORTED_CHANNELS or channels_per_pixel > pixels.shape[2]:
+        raise ValueError(f"Cannot pack {channels_per_pixel} channels per pixel into this image.")
+    if lsb_depth not in SUPPORTED_DEPTHS:
+        raise ValueError(f"LSB depth must be one of {SUPPORTED_DEPTHS}.")
+    if layout == LAYOUT_TILED:
+        stripes = iter_array_stripes(pixels, tile_rows)
+        for _ in embed_tiled(stripes, pixels.shape[1], pixels.shape[0], password, message, flags, tile_rows, channels_per_pixel, lsb_depth):
+            pass
+        return tiled_header_positions(pixels.shape[1], password), payload_to_bits(pack_header(
+            layout, flags | format_flags(channels_per_pixel, lsb_depth) | tile_flags(tile_rows), len(message), password))
+    header_bits = payload_to_bits(pack_header(layout, flags | format_flags(channels_per_pixel, lsb_depth), len(message), password))
+    body_bits = payload_to_bits(message)
+    end = HEADER_BITS + body_pixel_count(len(body_bits), channels_per_pixel, lsb_depth)
+    positions = layout_pixel_positions(layout, img_size, password, end)
+    if len(positions) < end:
+        raise ValueError("Message is too large for the image.")
+    embed_bits(pixels, positions[:HEADER_BITS], header_bits)
+    embed_bits(pixels, positions[HEADER_BITS:], body_bits, HEADER_BITS, channels_per_pixel, lsb_depth)
+    body_positions = np.repeat(positions[HEADER_BITS:], channels_per_pixel * lsb_depth)[:len(body_bits)]
+    return np.concatenate([positions[:HEADER_BITS], body_positions]), np.concatenate([header_bits, body_bits])
+
+def prepare_message(text, layout, codec="none", front_loaded=False):
+    """Turn text or bytes into the stored message and its header flags for the given layout."""
+    if layout == LAYOUT_LEGACY:
+        if codec != "none":
+            raise ValueError("The legacy layout does not support compression.")
+        return text.encode('latin-1') if isinstance(text, str) else bytes(text), 0
+    message, flags = encode_message(text, codec)
+    if front_loaded and layout == LAYOUT_TILED:
+        flags |= FLAG_FRONT_LOADED
+    return message, flags
+
+def encode_text_to_image(text, password, img_path, debug=False, layout=LAYOUT_FEISTEL, channels_per_pixel=1, lsb_depth=1, codec="none",
+                         tile_rows=DEFAULT_TILE_ROWS, front_loaded=False, out_path="encoded_message.png"):
+    """Encode text into an existing image's LSBs while preserving transparency if present.
+    
+    text may be a str, stored as UTF-8, or bytes. codec ("none", "zlib", "lzma", "bz2" or
+    "zstd") compresses the payload before embedding and is recorded in the header.
+    channels_per_pixel selects how many channels of each selected pixel carry body bits:
+    1 (one bit per pixel), 3 (RGB) or 4 (RGBA, only for images with an alpha channel).
+    lsb_depth (1-4) is how many low bits of each of those channels are replaced.
+    tile_rows is the stripe height for LAYOUT_TILED and front_loaded keeps short payloads in its
+    first stripe; see encode_tiled_image to stream large carriers.
+    The legacy layout supports neither options nor characters above U+00FF.
+    The result is written to out_path as PNG.
+    """
     img = Image.open(img_path)
     if img.mode not in ["RGB", "RGBA"]:
         img = img.convert("RGB")
     pixels = np.array(img)
-    img_size = pixels.shape[0], pixels.shape[1]
-    message_length = len(text)
-    binary_length = format(message_length, '032b')
-    binary_message = binary_length + ''.join([format(ord(char), '08b') for char in text])
-    pixel_positions = generate_pixel_positions(img_size, password, len(binary_message))
+    message, flags = prepare_message(text, layout, codec, front_loaded)
+    pixel_positions, bits = embed_payload(pixels, password, message, layout, channels_per_pixel, lsb_depth, flags, tile_rows)
     
-    # Open the debug log file for writing if debug mode is enabled
+    # Write the pixel-to-bit mapping to the debug log if debug mode is enabled
     if debug:
         with open("debugLog.txt", "w") as debug_file:
             debug_file.write("Encoding Map (Pixel -> Character):\n")
+            debug_file.writelines(f"Pixel {pos} -> Bit: {bit}\n" for pos, bit in zip(pixel_positions, bits))
     
-    for i, bit in enumerate(binary_message):
-        pos = pixel_positions[i]
-        row = pos // img_size[1]
-        col = pos % img_size[1]
-        channel = i % 3
-        pixels[row, col, channel] = (pixels[row, col, channel] & 0xFE) | int(bit)
+    encoded_img = Image.fromarray(pixels)
+    encoded_img.save(out_path, format="PNG")
+    return out_path, encoded_img
+
+def _encode_job(job):
+    if "out_path" not in job:
+        raise ValueError("Each job needs its own out_path.")
+    if job.get("debug"):
+        raise ValueError("Debug logs cannot be written from concurrent jobs.")
+    return encode_text_to_image(**job)[0]
 
-        # Log the pixel-to-character mapping if debug mode is enabled
-        if debug:
-            with open("debugLog.txt", "a") as debug_file:
-                debug_file.write(f"Pixel {pos} -> Bit: {bit}\n")
+def encode_many(jobs, workers=4, max_pending=None):
+    """Run encode_text_to_image jobs on a thread pool, yielding an EncodeResult per job in job order.
     
-    encoded_img = Image.fromarray(pixels)
-    encoded_img.save('encoded_message.png')
-    return 'encoded_message.png', encoded_img
+    Each job is a dict of encode_text_to_image keyword arguments and must name its own out_path.
+    The NumPy scatter and PNG compression release the GIL, so threads share one interpreter and
+    one permutation_cache. jobs may be a lazy iterable; at most max_pending jobs (default four per
+    worker) are in flight, which bounds memory however long the batch is. A failing job is reported
+    through the error field of its result and does not stop the batch.
+    """
+    if max_pending is None:
+        max_pending = workers * 4
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, job in enumerate(jobs):
+            pending.append((index, job.get("out_path"), executor.submit(_encode_job, job)))
+            if len(pending) >= max_pending:
+                yield _encode_result(*pending.popleft())
+        while pending:
+            yield _encode_result(*pending.popleft())
+
+def _encode_result(index, out_path, future):
+    error = future.exception()
+    return EncodeResult(index, out_path, error)
 
-def generate_pixel_positions(img_size, password, message_length):
-    """Generate a list of random pixel positions to store the encoded message."""
+def generate_pixel_positions(img_size, password, message_length, cache=True):
+    """Generate a list of random pixel positions to store the encoded message.
+    
+    cache controls permutation_cache: True looks the permutation up and stores it on a miss,
+    "read" only looks it up, and False does neither. Callers that cannot yet tell whether the
+    permutation is worth keeping should pass "read", so a repeated decode still hits the cache.
+    """
+    cached = permutation_cache.get(password, img_size, LAYOUT_LEGACY, message_length) if cache else None
+    if cached is not None:
+        return cached[:message_length].tolist()
     total_pixels = img_size[0] * img_size[1]
     hash_object = hashlib.sha256(password.encode())
     password_hash = hash_object.digest()
-    random.seed(password_hash)
+    # A private generator seeded exactly as the global one used to be, so concurrent calls cannot interleave.
+    rng = random.Random(password_hash)
     all_positions = list(range(total_pixels))
-    random.shuffle(all_positions)
+    rng.shuffle(all_positions)
+    if cache is True:
+        permutation_cache.put(password, img_size, LAYOUT_LEGACY, all_positions)
     return all_positions[:message_length]
 
+def iter_lazy_pixel_positions(img_size, password):
+    """Lazily yield a password-keyed permutation of the pixel indices using a sparse Fisher-Yates shuffle."""
+    total_pixels = img_size[0] * img_size[1]
+    rng = random.Random(hashlib.sha256(b"steganocrypt-lazy:" + password.encode()).digest())
+    swapped = {}
+    for i in range(total_pixels):
+        j = rng.randrange(i, total_pixels)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.pop(i, i)
+
+def generate_lazy_pixel_positions(img_size, password, message_length, cache=True):
+    """Return the first message_length positions of the lazy permutation in O(message_length) time and memory.
+    
+    cache takes the same True / "read" / False values as in generate_pixel_positions.
+    """
+    cached = permutation_cache.get(password, img_size, LAYOUT_LAZY, message_length) if cache else None
+    if cached is not None:
+        return np.asarray(cached[:message_length], dtype=np.int64)
+    count = min(message_length, img_size[0] * img_size[1])
+    positions = np.fromiter(itertools.islice(iter_lazy_pixel_positions(img_size, password), count), dtype=np.int64, count=count)
+    if cache is True:
+        permutation_cache.put(password, img_size, LAYOUT_LAZY, positions)
+    return positions
+
+def feistel_round_keys(password):
+    """Derive the Feistel round keys for a password."""
+    digest = hashlib.sha512(b"steganocrypt-feistel:" + password.encode()).digest()
+    return np.frombuffer(digest[:FEISTEL_ROUNDS * 8], dtype=">u8").astype(np.uint64)
+
+def _feistel_round(half, key, half_bits):
+    """Keyed SplitMix64-style round function, truncated to half_bits."""
+    z = (half + key) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return z & np.uint64((1 << half_bits) - 1)
+
+def _feistel_permute(values, round_keys, half_bits):
+    """Apply the balanced Feistel network to values in [0, 4**half_bits)."""
+    mask = np.uint64((1 << half_bits) - 1)
+    left = values >> np.uint64(half_bits)
+    right = values & mask
+    for key in round_keys:
+        left, right = right, left ^ _feistel_round(right, key, half_bits)
+    return (left << np.uint64(half_bits)) | right
+
+def feistel_pixel_positions(img_size, password, indices):
+    """Map payload bit indices to pixel positions through a keyed Feistel permutation of [0, total_pixels).
+    
+    Each index is resolved independently, so any slice of the payload can be located without
+    generating the positions before it. Values outside the image are cycle-walked back into range.
+    """
+    total_pixels = img_size[0] * img_size[1]
+    half_bits = max(1, ((total_pixels - 1).bit_length() + 1) // 2)
+    round_keys = feistel_round_keys(password)
+    positions = _feistel_permute(np.asarray(indices, dtype=np.uint64).reshape(-1), round_keys, half_bits)
+    outside = np.flatnonzero(positions >= total_pixels)
+    while len(outside):
+        positions[outside] = _feistel_permute(positions[outside], round_keys, half_bits)
+        outside = outside[positions[outside] >= total_pixels]
+    return positions.astype(np.int64)
+
+def generate_feistel_pixel_positions(img_size, password, message_length, start=0):
+    """Return positions start .. message_length - 1 of the Feistel permutation, without building the ones before start."""
+    stop = min(message_length, img_size[0] * img_size[1])
+    return feistel_pixel_positions(img_size, password, np.arange(start, max(start, stop), dtype=np.uint64))
+
+def layout_pixel_positions(layout, img_size, password, message_length, start=0, cache=True):
+    """Generate the pixel positions of payload bits start .. message_length - 1 for the given layout.
+    
+    cache is passed on to the legacy and lazy generators: True looks up and stores, "read" only
+    looks up and False bypasses permutation_cache entirely.
+    """
+    if layout == LAYOUT_LEGACY:
+        return np.asarray(generate_pixel_positions(img_size, password, message_length, cache)[start:], dtype=np.int64)
+    if layout == LAYOUT_LAZY:
+        return generate_lazy_pixel_positions(img_size, password, message_length, cache)[start:]
+    if layout == LAYOUT_FEISTEL:
+        return generate_feistel_pixel_positions(img_size, password, message_length, start)
+    if layout == LAYOUT_TILED:
+        # Only the header, which lives in the first row, can be located without the stripe plan
+        return tiled_header_positions(img_size[1], password)[start:message_length]
+    raise ValueError(f"Unknown layout: {layout}")
+
+def read_header(pixels, password, layouts=VERSIONED_LAYOUTS, allow_legacy=True):
+    """Resolve and read only the header bits, returning the header and the index of the first body bit.
+    
+    The given versioned layouts are tried first; an image without a versioned header is read as
+    legacy, whose full shuffle is returned alongside so the body can be located without reshuffling.
+    With allow_legacy=False, None is returned instead, which keeps a wrong password as cheap as
+    reading the header. The legacy shuffle is looked up in permutation_cache but not stored,
+    since the header may not exist; read_payload stores it once the length checks out.
+    """
+    img_size = pixels.shape[0], pixels.shape[1]
+    for layout in layouts:
+        positions = layout_pixel_positions(layout, img_size, password, HEADER_BITS, cache=False)
+        if len(positions) < HEADER_BITS:
+            continue
+        header = unpack_header(np.packbits(extract_bits(pixels, positions)).tobytes(), password)
+        if header is not None and header.layout == layout:
+            return header, HEADER_BITS, None
+    if not allow_legacy:
+        return None
+    positions = layout_pixel_positions(LAYOUT_LEGACY, img_size, password, img_size[0] * img_size[1], cache="read")
+    length = int.from_bytes(np.packbits(extract_bits(pixels, positions[:32])).tobytes(), 'big')
+    return PayloadHeader(LAYOUT_LEGACY, 0, length), 32, positions
+
+def read_payload(pixels, password, allow_legacy=True):
+    """Decode in two phases: read the header, validate its length, then read exactly the body bits.
+    
+    Returns the header, the stored message bytes and the per-bit body positions and bits.
+    With allow_legacy=False an image without a versioned header for password raises ValueError
+    instead of being read as legacy.
+    """
+    img_size = pixels.shape[0], pixels.shape[1]
+    found = read_header(pixels, password, allow_legacy=allow_legacy)
+    if found is None:
+        raise ValueError("No payload header found for this password.")
+    header, start, legacy_positions = found
+    if header.layout == LAYOUT_TILED:
+        stripes = iter_array_stripes(pixels, 1 << ((header.flags & FLAG_TILE_MASK) >> FLAG_TILE_SHIFT))
+        return (header,) + read_tiled_body(stripes, img_size[1], img_size[0], password, header, with_positions=True)
+    channels_per_pixel, lsb_depth = parse_flags(header.flags)
+    if channels_per_pixel not in SUPPORTED_CHANNELS or channels_per_pixel > pixels.shape[2]:
+        raise IndexError("Header names a channel packing this image cannot hold.")
+    bit_count = header.length * 8
+    end = start + body_pixel_count(bit_count, channels_per_pixel, lsb_depth)
+    if end > img_size[0] * img_size[1]:
+        raise IndexError("Message length exceeds the image capacity.")
+    if legacy_positions is not None:
+        # The length fits the image, so this is plausibly a legacy payload worth caching the shuffle for
+        permutation_cache.put(password, img_size, LAYOUT_LEGACY, legacy_positions)
+        body_positions = legacy_positions[start:end]
+    else:
+        body_positions = layout_pixel_positions(header.layout, img_size, password, end, start=start)
+    body_bits = extract_bits(pixels, body_positions, start, channels_per_pixel, bit_count, lsb_depth)
+    bit_positions = np.repeat(body_positions, channels_per_pixel * lsb_depth)[:bit_count]
+    return header, np.packbits(body_bits).tobytes(), bit_positions, body_bits
+
+def _read_chunks(reader, chunk_size):
+    """Yield successive chunks read from a binary file-like object."""
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def _compress_chunks(chunks, codec_id):
+    """Pass chunks through an incremental compressor for the given codec."""
+    if codec_id == 0:
+        yield from chunks
+        return
+    compressor = STREAM_CODECS[codec_id][0]()
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.flush()
+
+def _rechunk(chunks, chunk_size):
+    """Regroup a stream of byte strings into blocks of exactly chunk_size bytes (the last may be shorter)."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+def embed_stream(reader, carrier, password, chunk_size=STREAM_CHUNK_SIZE, channels_per_pixel=1, lsb_depth=1, codec="none"):
+    """Embed everything read from a binary file-like object into a carrier pixel array in place.
+    
+    The payload flows through a read -> compress -> rechunk generator pipeline and each block is
+    written straight to its Feistel positions, so peak memory is bounded by chunk_size plus the
+    pixel array. The header, which needs the final length, is written last. If the carrier runs
+    out of room a ValueError is raised and the carrier is left partially written.
+    Returns the number of stored (post-compression) bytes.
+    """
+    if codec not in CODEC_IDS:
+        raise ValueError(f"Unknown codec: {codec}")
+    if channels_per_pixel not in SUPPORTED_CHANNELS or channels_per_pixel > carrier.shape[2]:
+        raise ValueError(f"Cannot pack {channels_per_pixel} channels per pixel into this image.")
+    if lsb_depth not in SUPPORTED_DEPTHS:
+        raise ValueError(f"LSB depth must be one of {SUPPORTED_DEPTHS}.")
+    img_size = carrier.shape[0], carrier.shape[1]
+    total_pixels = img_size[0] * img_size[1]
+    bits_per_pixel = channels_per_pixel * lsb_depth
+    # Keep every block aligned to whole pixels so it starts on a fresh position
+    chunk_size = -(-chunk_size // bits_per_pixel) * bits_per_pixel
+    codec_id = CODEC_IDS[codec]
+    offset = 0
+    for chunk in _rechunk(_compress_chunks(_read_chunks(reader, chunk_size), codec_id), chunk_size):
+        first = HEADER_BITS + offset * 8 // bits_per_pixel
+        end = HEADER_BITS + body_pixel_count((offset + len(chunk)) * 8, channels_per_pixel, lsb_depth)
+        if end > total_pixels:
+            raise ValueError("Payload is too large for the image.")
+        positions = layout_pixel_positions(LAYOUT_FEISTEL, img_size, password, end, start=first)
+        embed_bits(carrier, positions, payload_to_bits(chunk), first, channels_per_pixel, lsb_depth)
+        offset += len(chunk)
+    if offset >= 2 ** 32:
+        raise ValueError("Payload is too large for the header length field.")
+    flags = codec_id << FLAG_CODEC_SHIFT | format_flags(channels_per_pixel, lsb_depth)
+    header_positions = layout_pixel_positions(LAYOUT_FEISTEL, img_size, password, HEADER_BITS)
+    if len(header_positions) < HEADER_BITS:
+        raise ValueError("Image is too small to hold a header.")
+    embed_bits(carrier, header_positions, payload_to_bits(pack_header(LAYOUT_FEISTEL, flags, offset, password)))
+    return offset
+
+def extract_stream(carrier, writer, password, chunk_size=STREAM_CHUNK_SIZE):
+    """Extract a payload embedded with embed_stream (or any Feistel-layout image) into a binary writer.
+    
+    The body is read and decompressed one chunk at a time. Returns the number of bytes written.
+    """
+    img_size = carrier.shape[0], carrier.shape[1]
+    found = read_header(carrier, password, layouts=(LAYOUT_FEISTEL,), allow_legacy=False)
+    if found is None:
+        raise ValueError("No streamable payload found for this password.")
+    header = found[0]
+    channels_per_pixel, lsb_depth = parse_flags(header.flags)
+    if channels_per_pixel not in SUPPORTED_CHANNELS or channels_per_pixel > carrier.shape[2]:
+        raise ValueError("Header names a channel packing this image cannot hold.")
+    if HEADER_BITS + body_pixel_count(header.length * 8, channels_per_pixel, lsb_depth) > img_size[0] * img_size[1]:
+        raise ValueError("Message length exceeds the image capacity.")
+    codec_id = (header.flags & FLAG_CODEC_MASK) >> FLAG_CODEC_SHIFT
+    if codec_id not in CODECS:
+        raise ValueError(f"Unknown codec id in header: {codec_id}")
+    decompressor = STREAM_CODECS[codec_id][1]() if codec_id else None
+    bits_per_pixel = channels_per_pixel * lsb_depth
+    chunk_size = -(-chunk_size // bits_per_pixel) * bits_per_pixel
+    written = 0
+    for offset in range(0, header.length, chunk_size):
+        size = min(chunk_size, header.length - offset)
+        first = HEADER_BITS + offset * 8 // bits_per_pixel
+        end = HEADER_BITS + body_pixel_count((offset + size) * 8, channels_per_pixel, lsb_depth)
+        positions = layout_pixel_positions(LAYOUT_FEISTEL, img_size, password, end, start=first)
+        chunk = np.packbits(extract_bits(carrier, positions, first, channels_per_pixel, size * 8, lsb_depth)).tobytes()
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        writer.write(chunk)
+        written += len(chunk)
+    if decompressor is not None and hasattr(decompressor, "flush"):
+        tail = decompressor.flush()
+        writer.write(tail)
+        written += len(tail)
+    return written
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_SAMPLES = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # samples per pixel for each PNG colour type
+
+def _png_chunks(png_file):
+    """Yield (type, data) for each chunk of a PNG file, stopping after IEND."""
+    if png_file.read(8) != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file.")
+    while True:
+        head = png_file.read(8)
+        if len(head) < 8:
+            raise ValueError("Truncated PNG file.")
+        length, chunk_type = struct.unpack(">I4s", head)
+        data = png_file.read(length)
+        png_file.read(4)
+        yield chunk_type, data
+        if chunk_type == b"IEND":
+            return
+
+def _png_chunk(chunk_type, data):
+    """Serialize one PNG chunk."""
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def _unfilter_png_rows(ihdr, extra_chunks, previous, raw, rows):
+    """Unfilter a run of raw PNG scanlines, returning (RGB/RGBA pixels, last row's unfiltered bytes).
+    
+    The scanlines are wrapped, behind the previous unfiltered row, in a minimal stored-deflate
+    PNG so that PIL's C unfilter does the per-byte work.
+    """
+    width, _, bit_depth, color_type = struct.unpack(">IIBB", ihdr[:10])
+    if previous is not None:
+        raw = b"\x00" + previous + raw
+        rows += 1
+    header = struct.pack(">IIBBBBB", width, rows, bit_depth, color_type, 0, 0, 0)
+    png = (PNG_SIGNATURE + _png_chunk(b"IHDR", header) + b"".join(extra_chunks)
+           + _png_chunk(b"IDAT", zlib.compress(raw, 0)) + _png_chunk(b"IEND", b""))
+    img = Image.open(io.BytesIO(png))
+    img.load()
+    last_row = np.asarray(img)[-1].tobytes()
+    if previous is not None:
+        img = img.crop((0, 1, width, rows))
+    if img.mode not in ["RGB", "RGBA"]:
+        img = img.convert("RGB")
+    return np.array(img), last_row
+
+def iter_png_stripes(img_path, stripe_rows):
+    """Yield an 8-bit, non-interlaced PNG as successive (stripe_rows, width, channels) pixel arrays.
+    
+    IDAT data is inflated incrementally, so only about one stripe of the image is held at a time.
+    Colour types other than RGB/RGBA are converted to RGB, as in encode_text_to_image.
+    """
+    with open(img_path, "rb") as png_file:
+        chunks = _png_chunks(png_file)
+        chunk_type, ihdr = next(chunks)
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+        if chunk_type != b"IHDR" or bit_depth != 8 or interlace:
+            raise ValueError("Only 8-bit, non-interlaced PNG files can be streamed.")
+        row_bytes = 1 + width * PNG_SAMPLES[color_type]
+        extra_chunks = []
+        inflater = zlib.decompressobj()
+        pending = bytearray()
+        previous = None
+        remaining = height
+        for chunk_type, data in chunks:
+            if chunk_type in (b"PLTE", b"tRNS"):
+                extra_chunks.append(_png_chunk(chunk_type, data))
+            elif chunk_type == b"IDAT":
+                while remaining:
+                    inflated = inflater.decompress(data, stripe_rows * row_bytes)
+                    data = inflater.unconsumed_tail
+                    pending += inflated
+                    while remaining and len(pending) >= min(stripe_rows, remaining) * row_bytes:
+                        rows = min(stripe_rows, remaining)
+                        stripe, previous = _unfilter_png_rows(ihdr, extra_chunks, previous, bytes(pending[:rows * row_bytes]), rows)
+                        del pending[:rows * row_bytes]
+                        remaining -= rows
+                        yield stripe
+                    if not data and not inflated:
+                        break
+            if not remaining:
+                return
+        raise ValueError("PNG image data ended early.")
+
+def iter_array_stripes(pixels, stripe_rows):
+    """Yield views of successive stripe_rows-high stripes of a pixel array."""
+    for y in range(0, pixels.shape[0], stripe_rows):
+        yield pixels[y:y + stripe_rows]
+
+def is_streamable_png(img_path, img):
+    """Return whether an opened image is an 8-bit, non-interlaced PNG that iter_png_stripes can read."""
+    if img.format != "PNG":
+        return False
+    with open(img_path, "rb") as png_file:
+        bit_depth, _, _, _, interlace = struct.unpack(">BBBBB", png_file.read(29)[24:29])
+    return bit_depth == 8 and not interlace
+
+def open_image_stripes(img_path, stripe_rows):
+    """Return (width, height, channels, stripes) for a carrier, streaming it when it is a simple PNG.
+    
+    Other formats are decoded in full by PIL and then handed out stripe by stripe.
+    """
+    img = Image.open(img_path)
+    width, height = img.size
+    channels = 4 if img.mode == "RGBA" else 3
+    if is_streamable_png(img_path, img):
+        return width, height, channels, iter_png_stripes(img_path, stripe_rows)
+    if img.mode not in ["RGB", "RGBA"]:
+        img = img.convert("RGB")
+    return width, height, channels, iter_array_stripes(np.array(img), stripe_rows)
+
+def write_png_stripes(out_path, width, height, channels, stripes, compress_level=6):
+    """Write an iterable of pixel stripes as an RGB or RGBA PNG without assembling the whole image."""
+    with open(out_path, "wb") as png_file:
+        header = struct.pack(">IIBBBBB", width, height, 8, 6 if channels == 4 else 2, 0, 0, 0)
+        png_file.write(PNG_SIGNATURE + _png_chunk(b"IHDR", header))
+        deflater = zlib.compressobj(compress_level)
+        for stripe in stripes:
+            rows = stripe.reshape(stripe.shape[0], -1)
+            # Sub filter: each byte minus the same channel of the pixel to its left
+            filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+            filtered[:, 0] = 1
+            filtered[:, 1:channels + 1] = rows[:, :channels]
+            np.subtract(rows[:, channels:], rows[:, :-channels], out=filtered[:, channels + 1:])
+            data = deflater.compress(filtered.tobytes())
+            if data:
+                png_file.write(_png_chunk(b"IDAT", data))
+        png_file.write(_png_chunk(b"IDAT", deflater.flush()) + _png_chunk(b"IEND", b""))
+
+def tile_flags(tile_rows):
+    """Header flag bits recording the stripe height, which must be a power of two."""
+    if tile_rows < 1 or tile_rows & (tile_rows - 1) or tile_rows.bit_length() > 32:
+        raise ValueError("tile_rows must be a power of two.")
+    return (tile_rows.bit_length() - 1) << FLAG_TILE_SHIFT
+
+def tiled_header_positions(width, password):
+    """Header positions for LAYOUT_TILED: a keyed permutation of the first row, independent of the stripe height."""
+    return feistel_pixel_positions((1, width), password + "\x00tile-header", np.arange(min(HEADER_BITS, width), dtype=np.uint64))
+
+def tile_plan(width, height, tile_rows, slot_count, front_loaded=False):
+    """Split slot_count body pixels across the stripes in proportion to their free capacity.
+    
+    With front_loaded the stripes are instead filled one after another. Returns a
+    (first_slot, end_slot) pair per stripe. Stripe 0 loses the header pixels.
+    """
+    stripe_count = -(-height // tile_rows)
+    capacities = [min(tile_rows, height - s * tile_rows) * width for s in range(stripe_count)]
+    capacities[0] -= HEADER_BITS
+    total = sum(capacities)
+    if width < HEADER_BITS or slot_count > total:
+        raise ValueError("Message is too large for the image.")
+    if front_loaded:
+        bounds = [0] + [min(slot_count, cumulative) for cumulative in itertools.accumulate(capacities)]
+    else:
+        bounds = [0] + [slot_count * cumulative // total for cumulative in itertools.accumulate(capacities)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def tile_body_positions(stripe_shape, password, stripe_index, count, header_positions=None):
+    """Positions of the first count body pixels of a stripe, from the stripe's own keyed permutation.
+    
+    Stripe 0 skips the pixels already taken by the header.
+    """
+    key = f"{password}\x00tile:{stripe_index}"
+    if header_positions is None:
+        return feistel_pixel_positions(stripe_shape, key, np.arange(count, dtype=np.uint64))
+    total_pixels = stripe_shape[0] * stripe_shape[1]
+    candidates = feistel_pixel_positions(stripe_shape, key, np.arange(min(count + len(header_positions), total_pixels), dtype=np.uint64))
+    return candidates[~np.isin(candidates, header_positions)][:count]
+
+def embed_tiled(stripes, width, height, password, message, flags=0, tile_rows=DEFAULT_TILE_ROWS, channels_per_pixel=1, lsb_depth=1):
+    """Embed message bytes into an iterable of pixel stripes, yielding each stripe once it is written.
+    
+    Each stripe draws positions from its own keyed permutation, so only one stripe needs to be
+    in memory. The header goes in the first row. Include FLAG_FRONT_LOADED in flags to fill
+    the stripes in order.
+    """
+    if channels_per_pixel not in SUPPORTED_CHANNELS or lsb_depth not in SUPPORTED_DEPTHS:
+        raise ValueError("Unsupported channel packing or LSB depth.")
+    flags |= format_flags(channels_per_pixel, lsb_depth) | tile_flags(tile_rows)
+    bits_per_pixel = channels_per_pixel * lsb_depth
+    body_bits = payload_to_bits(message)
+    plan = tile_plan(width, height, tile_rows, body_pixel_count(len(body_bits), channels_per_pixel, lsb_depth), flags & FLAG_FRONT_LOADED)
+    header_positions = tiled_header_positions(width, password)
+    for stripe_index, stripe in enumerate(stripes):
+        if channels_per_pixel > stripe.shape[2]:
+            raise ValueError(f"Cannot pack {channels_per_pixel} channels per pixel into this image.")
+        first, end = plan[stripe_index]
+        positions = tile_body_positions(stripe.shape[:2], password, stripe_index, end - first, header_positions if stripe_index == 0 else None)
+        embed_bits(stripe, positions, body_bits[first * bits_per_pixel:end * bits_per_pixel], first, channels_per_pixel, lsb_depth)
+        if stripe_index == 0:
+            embed_bits(stripe, header_positions, payload_to_bits(pack_header(LAYOUT_TILED, flags, len(message), password)))
+        yield stripe
+
+def read_tiled_body(stripes, width, height, password, header, with_positions=False):
+    """Read a LAYOUT_TILED body from an iterable of pixel stripes whose height matches the header.
+    
+    Iteration stops after the last stripe holding body bits, which for front-loaded payloads
+    lets a streaming reader skip inflating the rest of the image.
+    Returns (data, bit_positions, bits); positions are only collected with with_positions=True.
+    """
+    channels_per_pixel, lsb_depth = parse_flags(header.flags)
+    tile_rows = 1 << ((header.flags & FLAG_TILE_MASK) >> FLAG_TILE_SHIFT)
+    bit_count = header.length * 8
+    bits_per_pixel = channels_per_pixel * lsb_depth
+    plan = tile_plan(width, height, tile_rows, body_pixel_count(bit_count, channels_per_pixel, lsb_depth), header.flags & FLAG_FRONT_LOADED)
+    needed = max((index + 1 for index, (first, end) in enumerate(plan) if end > first), default=1)
+    header_positions = tiled_header_positions(width, password)
+    bits, bit_positions = [], []
+    for stripe_index, stripe in zip(range(needed), stripes):
+        if channels_per_pixel > stripe.shape[2]:
+            raise ValueError("Header names a channel packing this image cannot hold.")
+        first, end = plan[stripe_index]
+        positions = tile_body_positions(stripe.shape[:2], password, stripe_index, end - first, header_positions if stripe_index == 0 else None)
+        count = min(end * bits_per_pixel, bit_count) - first * bits_per_pixel
+        bits.append(extract_bits(stripe, positions, first, channels_per_pixel, count, lsb_depth))
+        if with_positions:
+            bit_positions.append(np.repeat(positions + stripe_index * tile_rows * width, bits_per_pixel)[:count])
+    bits = np.concatenate(bits) if bits else np.zeros(0, dtype=np.uint8)
+    bit_positions = np.concatenate(bit_positions) if bit_positions else np.zeros(0, dtype=np.int64)
+    return np.packbits(bits).tobytes(), bit_positions, bits
+
+def encode_tiled_image(text, password, img_path, out_path="encoded_message.png", tile_rows=DEFAULT_TILE_ROWS,
+                       channels_per_pixel=1, lsb_depth=1, codec="none", front_loaded=False):
+    """Encode into a carrier stripe by stripe, writing a LAYOUT_TILED PNG without loading the whole image.
+    
+    For 8-bit PNG carriers peak memory is proportional to tile_rows * width rather than the image size.
+    With front_loaded a payload that fits in the first tile_rows rows is kept there, so
+    decode_tiled_image only has to inflate those rows.
+    """
+    width, height, channels, stripes = open_image_stripes(img_path, tile_rows)
+    message, flags = encode_message(text, codec)
+    if front_loaded:
+        flags |= FLAG_FRONT_LOADED
+    embedded = embed_tiled(stripes, width, height, password, message, flags, tile_rows, channels_per_pixel, lsb_depth)
+    write_png_stripes(out_path, width, height, channels, embedded)
+    return out_path
+
+def decode_tiled_image(password, img_path):
+    """Decode a LAYOUT_TILED image stripe by stripe, reading the stripe height from the header in row 0.
+    
+    Streaming stops after the last stripe holding payload bits, so for front-loaded PNGs only
+    the leading rows are ever inflated.
+    """
+    _, _, _, first_row = open_image_stripes(img_path, 1)
+    row = next(first_row)
+    first_row.close()
+    found = read_header(row, password, layouts=(LAYOUT_TILED,), allow_legacy=False)
+    if found is None:
+        raise ValueError("No tiled payload found for this password.")
+    header = found[0]
+    width, height, _, stripes = open_image_stripes(img_path, 1 << ((header.flags & FLAG_TILE_MASK) >> FLAG_TILE_SHIFT))
+    try:
+        data = read_tiled_body(stripes, width, height, password, header)[0]
+    finally:
+        stripes.close()
+    return decode_message(data, header.flags)
+
+# Uncompressed raw modes that can be edited in place: logical mode, byte of R, G, B (and A)
+# within a pixel, and bytes per pixel.
+MAPPED_RAWMODES = {
+    "RGB": ("RGB", (0, 1, 2), 3),
+    "BGR": ("RGB", (2, 1, 0), 3),
+    "RGBX": ("RGB", (0, 1, 2), 4),
+    "BGRX": ("RGB", (2, 1, 0), 4),
+    "RGBA": ("RGBA", (0, 1, 2, 3), 4),
+    "BGRA": ("RGBA", (2, 1, 0, 3), 4),
+}
+
+class MappedCarrier:
+    """A memory-mapped uncompressed carrier (BMP, PPM, uncompressed TIFF, TGA) addressed like a pixel array.
+    
+    The engine only needs shape and flat element offsets, which are translated to file byte
+    offsets through PIL's raw tile descriptors, so only the touched bytes are paged in or written.
+    """
+    
+    def __init__(self, img_path, writable=False):
+        img = Image.open(img_path)
+        tiles = sorted(img.tile, key=lambda tile: tile[1][1])
+        width, height = img.size
+        rawmodes = set()
+        starts, offsets, strides, steps, ends = [], [], [], [], []
+        for codec_name, extents, offset, args in tiles:
+            rawmode, stride, step = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+            if codec_name != "raw" or rawmode not in MAPPED_RAWMODES or extents[0] != 0 or extents[2] != width:
+                raise ValueError(f"{img_path} is not an uncompressed RGB/RGBA carrier that can be edited in place.")
+            rawmodes.add(rawmode)
+            starts.append(extents[1])
+            ends.append(extents[3])
+            offsets.append(offset)
+            strides.append(stride or width * MAPPED_RAWMODES[rawmode][2])
+            steps.append(step)
+        if len(rawmodes) != 1:
+            raise ValueError(f"{img_path} mixes pixel formats across strips.")
+        mode, channel_bytes, self.bytes_per_pixel = MAPPED_RAWMODES[rawmodes.pop()]
+        img.close()
+        self.shape = (height, width, len(mode))
+        self.dtype = np.dtype(np.uint8)
+        self.channel_bytes = np.array(channel_bytes, dtype=np.int64)
+        self.tile_starts = np.array(starts, dtype=np.int64)
+        self.tile_ends = np.array(ends, dtype=np.int64)
+        self.tile_offsets = np.array(offsets, dtype=np.int64)
+        self.tile_strides = np.array(strides, dtype=np.int64)
+        self.tile_steps = np.array(steps, dtype=np.int64)
+        self.buffer = np.memmap(img_path, dtype=np.uint8, mode="r+" if writable else "r")
+    
+    def byte_offsets(self, offsets):
+        """Translate flat offsets into the logical (height, width, channels) array to file byte offsets."""
+        pixel, channel = np.divmod(offsets, self.shape[2])
+        row, col = np.divmod(pixel, self.shape[1])
+        tile = np.searchsorted(self.tile_starts, row, side="right") - 1
+        file_row = np.where(self.tile_steps[tile] < 0, self.tile_ends[tile] - 1 - row, row - self.tile_starts[tile])
+        return (self.tile_offsets[tile] + file_row * self.tile_strides[tile]
+                + col * self.bytes_per_pixel + self.channel_bytes[channel])
+    
+    def flush(self):
+        """Write modified pages back to the file."""
+        self.buffer.flush()
+    
+    def close(self):
+        """Release the mapping."""
+        if self.buffer._mmap is not None:
+            self.buffer._mmap.close()
+
+def encode_in_place(text, password, img_path, layout=LAYOUT_FEISTEL, channels_per_pixel=1, lsb_depth=1, codec="none"):
+    """Encode into an uncompressed carrier file by flipping only the target bytes through a memory map.
+    
+    I/O scales with the payload rather than the image. The file keeps its format and is modified
+    in place, so callers wanting to keep the original must copy it first.
+    """
+    if layout == LAYOUT_TILED:
+        raise ValueError("The tiled layout is not supported for in-place encoding.")
+    carrier = MappedCarrier(img_path, writable=True)
+    try:
+        message, flags = prepare_message(text, layout, codec)
+        embed_payload(carrier, password, message, layout, channels_per_pixel, lsb_depth, flags)
+        carrier.flush()
+    finally:
+        carrier.close()
+    return img_path
+
+def decode_mapped(password, img_path):
+    """Decode an uncompressed carrier through a read-only memory map, reading only header and body bytes."""
+    carrier = MappedCarrier(img_path)
+    try:
+        header, data, _, _ = read_payload(carrier, password)
+    finally:
+        carrier.close()
+    if header.layout == LAYOUT_LEGACY:
+        return data.decode('latin-1')
+    return decode_message(data, header.flags)
+
+class CarrierCache:
+    """Decode carrier images once into shared memory so worker processes can attach without copying.
+    
+    get() returns a picklable SharedCarrier descriptor to hand to workers, which pass it to
+    encode_shared() or attach_carrier(). Entries are keyed by path, size and modification time
+    and evicted least recently used first once max_bytes is exceeded. Evicting unlinks the
+    segment: workers already attached keep their mapping, later attaches fail with
+    FileNotFoundError, so callers should get() a fresh descriptor per task.
+    """
+    
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def get(self, img_path):
+        """Return the SharedCarrier for img_path, decoding it into a new segment on a miss."""
+        stat = os.stat(img_path)
+        key = os.path.abspath(img_path), stat.st_size, stat.st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            img = Image.open(img_path)
+            if img.mode not in ["RGB", "RGBA"]:
+                img = img.convert("RGB")
+            pixels = np.asarray(img)
+            if pixels.nbytes > self.max_bytes:
+                raise ValueError("Carrier is larger than the cache budget.")
+            while self._entries and self._size + pixels.nbytes > self.max_bytes:
+                self._release(*self._entries.popitem(last=False)[1][:2])
+            segment = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+            np.ndarray(pixels.shape, pixels.dtype, buffer=segment.buf)[:] = pixels
+            carrier = SharedCarrier(segment.name, pixels.shape, pixels.dtype.str)
+            # Account for the pixel bytes, not segment.size, which may be rounded up to whole pages
+            self._entries[key] = segment, pixels.nbytes, carrier
+            self._size += pixels.nbytes
+            return carrier
+    
+    def _release(self, segment, nbytes):
+        self._size -= nbytes
+        segment.close()
+        segment.unlink()
+    
+    def clear(self):
+        """Unlink every cached segment and reset the counters."""
+        with self._lock:
+            while self._entries:
+                self._release(*self._entries.popitem()[1][:2])
+            self.hits = self.misses = 0
+    
+    def stats(self):
+        """Return hit/miss counters and current memory use."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "bytes": self._size, "max_bytes": self.max_bytes}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.clear()
+
+def attach_carrier(carrier):
+    """Attach to a SharedCarrier, returning the segment and a read-only pixel view of it.
+    
+    Drop the view before calling segment.close().
+    """
+    segment = shared_memory.SharedMemory(name=carrier.name)
+    pixels = np.ndarray(carrier.shape, np.dtype(carrier.dtype), buffer=segment.buf)
+    pixels.flags.writeable = False
+    return segment, pixels
+
+class CopyOnWriteCarrier:
+    """A read-only pixel array with a private overlay holding only the elements written to it.
+    
+    Like MappedCarrier it is addressed through buffer and byte_offsets, so the engine can embed
+    into a shared carrier without copying it; iter_stripes() then yields patched stripe copies.
+    """
+    
+    def __init__(self, base):
+        self.base = base
+        self.shape = base.shape
+        self.dtype = base.dtype
+        self.buffer = self
+        self._flat = base.reshape(-1)
+        self._offsets = np.empty(0, dtype=np.int64)
+        self._values = np.empty(0, dtype=base.dtype)
+    
+    def byte_offsets(self, offsets):
+        """Flat element offsets address the overlay directly."""
+        return offsets
+    
+    def __getitem__(self, index):
+        values = self._flat[index]
+        if len(self._offsets):
+            slots = np.searchsorted(self._offsets, index).clip(max=len(self._offsets) - 1)
+            written = self._offsets[slots] == index
+            values[written] = self._values[slots[written]]
+        return values
+    
+    def __setitem__(self, index, values):
+        index = np.asarray(index, dtype=np.int64)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), index.shape)
+        # np.unique keeps the first occurrence, so newer writes go first and, among them, the last one
+        offsets, first = np.unique(np.concatenate([index[::-1], self._offsets]), return_index=True)
+        self._offsets = offsets
+        self._values = np.concatenate([values[::-1], self._values])[first]
+    
+    def iter_stripes(self, stripe_rows):
+        """Yield copies of successive stripes of the base array with the overlay applied."""
+        row_size = self._flat.size // self.shape[0]
+        for y in range(0, self.shape[0], stripe_rows):
+            stripe = self.base[y:y + stripe_rows].copy()
+            lo, hi = np.searchsorted(self._offsets, [y * row_size, (y + stripe_rows) * row_size])
+            stripe.reshape(-1)[self._offsets[lo:hi] - y * row_size] = self._values[lo:hi]
+            yield stripe
+
+def encode_shared(text, password, carrier, out_path, layout=LAYOUT_FEISTEL, channels_per_pixel=1, lsb_depth=1, codec="none",
+                  stripe_rows=DEFAULT_TILE_ROWS):
+    """Encode into a CarrierCache carrier and write the result to out_path as PNG.
+    
+    Runs in any process: the shared pixels are never modified or copied whole; only the
+    embedded elements are held privately and the output is assembled one stripe at a time.
+    """
+    if layout == LAYOUT_TILED:
+        raise ValueError("The tiled layout is not supported for shared carriers; use encode_tiled_image.")
+    message, flags = prepare_message(text, layout, codec)
+    segment, pixels = attach_carrier(carrier)
+    overlay = CopyOnWriteCarrier(pixels)
+    try:
+        embed_payload(overlay, password, message, layout, channels_per_pixel, lsb_depth, flags)
+        write_png_stripes(out_path, pixels.shape[1], pixels.shape[0], pixels.shape[2], overlay.iter_stripes(stripe_rows))
+    finally:
+        del overlay, pixels
+        segment.close()
+    return out_path
+
+def probe(image, password):
+    """Check whether an image carries a versioned payload for password, reading only header bits.
+    
+    image is a path or a pixel array. Returns describe_header()'s dict, or None when no header
+    with a valid magic and MAC is found. Only two kinds of file are probed cheaply: uncompressed
+    carriers, through a memory map, and tiled PNGs, by inflating only their first row. Every
+    other file, including PNGs in the default Feistel layout, is decoded in full once.
+    Legacy images have no magic and always probe as None.
+    """
+    if not isinstance(image, (str, os.PathLike)):
+        found = read_header(image, password, allow_legacy=False)
+        return describe_header(found[0]) if found else None
+    try:
+        carrier = MappedCarrier(image)
+    except ValueError:
+        carrier = None
+    if carrier is not None:
+        try:
+            found = read_header(carrier, password, allow_legacy=False)
+        finally:
+            carrier.close()
+        return describe_header(found[0]) if found else None
+    img = Image.open(image)
+    layouts = VERSIONED_LAYOUTS
+    if is_streamable_png(image, img):
+        stripes = iter_png_stripes(image, 1)
+        try:
+            found = read_header(next(stripes), password, layouts=(LAYOUT_TILED,), allow_legacy=False)
+        finally:
+            stripes.close()
+        if found is not None:
+            return describe_header(found[0])
+        layouts = [layout for layout in VERSIONED_LAYOUTS if layout != LAYOUT_TILED]
+    if img.mode not in ["RGB", "RGBA"]:
+        img = img.convert("RGB")
+    found = read_header(np.array(img), password, layouts=layouts, allow_legacy=False)
+    return describe_header(found[0]) if found else None
+
+def benchmark_scatter(megapixels=(20, 50, 100), targets=1 << 20, repeat=3):
+    """Time random-order against memory-order gather/scatter on synthetic carriers.
+    
+    Returns one row per size with the best-of-repeat seconds for an embed followed by an extract
+    of targets bits in each order. The gap between them is the cost of cache and TLB misses
+    from random access, net of the sort.
+    """
+    rng = np.random.default_rng()
+    results = []
+    for size in megapixels:
+        total_pixels = int(size * 1_000_000)
+        pixels = rng.integers(0, 256, (total_pixels // 1000, 1000, 3), dtype=np.uint8)
+        positions = feistel_pixel_positions(pixels.shape[:2], "benchmark", np.arange(min(targets, pixels.shape[0] * 1000), dtype=np.uint64))
+        bits = rng.integers(0, 2, len(positions), dtype=np.uint8)
+        row = {"megapixels": size, "targets": len(positions)}
+        for label, sort_targets in (("random_order_s", False), ("memory_order_s", True)):
+            best = float("inf")
+            for _ in range(repeat):
+                began = time.perf_counter()
+                embed_bits(pixels, positions, bits, sort_targets=sort_targets)
+                extract_bits(pixels, positions, sort_targets=sort_targets)
+                best = min(best, time.perf_counter() - began)
+            row[label] = best
+        results.append(row)
+        del pixels
+    return results
+
+def stress_test(jobs=500, workers=16, img_size=(96, 192), seed=None):
+    """Run many embed/extract round trips concurrently on a thread pool.
+    
+    Each job draws its own password, payload and layout, so every permutation is built fresh
+    while other threads are building theirs. Because a corrupted permutation would also be
+    served back to the decoder from the cache, every carrier is then read again sequentially
+    after clearing permutation_cache, and one legacy carrier a third time to check that the
+    repeated decode hits the cache. Returns the list of (job, error) pairs that failed.
+    """
+    rng = np.random.default_rng(seed)
+    layouts = (LAYOUT_LEGACY,) + VERSIONED_LAYOUTS
+    specs = [(f"stress-{job}-{rng.integers(1 << 62)}", rng.bytes(int(rng.integers(0, 64))), layouts[job % len(layouts)], rng.integers(1 << 62))
+             for job in range(jobs)]
+    
+    def check(pixels, spec):
+        password, message, layout, _ = spec
+        header, data = read_payload(pixels, password)[:2]
+        if header.layout != layout or data != message:
+            raise AssertionError(f"layout {layout} round trip returned {data!r} for {message!r}")
+    
+    def round_trip(spec):
+        password, message, layout, carrier_seed = spec
+        pixels = np.random.default_rng(carrier_seed).integers(0, 256, img_size + (3,), dtype=np.uint8)
+        embed_payload(pixels, password, message, layout)
+        check(pixels, spec)
+        return pixels
+    
+    failures = []
+    carriers = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for job, future in enumerate([executor.submit(round_trip, spec) for spec in specs]):
+            error = future.exception()
+            if error is not None:
+                failures.append((job, error))
+            else:
+                carriers.append((job, future.result()))
+    permutation_cache.clear()
+    for job, pixels in carriers:
+        try:
+            check(pixels, specs[job])
+        except (AssertionError, IndexError, ValueError) as e:
+            failures.append((job, e))
+    # Decoding a legacy carrier again must be served from the cache rather than reshuffled
+    for job, pixels in carriers:
+        if specs[job][2] != LAYOUT_LEGACY:
+            continue
+        hits = permutation_cache.stats()["hits"]
+        try:
+            check(pixels, specs[job])
+            if permutation_cache.stats()["hits"] == hits:
+                raise AssertionError("repeated legacy decode missed permutation_cache")
+        except (AssertionError, IndexError, ValueError) as e:
+            failures.append((job, e))
+        break
+    return failures
+
+def run_command_line(argv):
+    """Command-line entry point for the non-GUI tools."""
+    parser = argparse.ArgumentParser(description="Steganography engine tools. Run without arguments for the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("bench-scatter", help="Benchmark random-order against memory-order bit scatter")
+    bench.add_argument("--megapixels", type=float, nargs="+", default=[20, 50, 100], help="Carrier sizes to test")
+    bench.add_argument("--targets", type=int, default=1 << 20, help="Payload bits per run")
+    bench.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is kept)")
+    probe_command = commands.add_parser("probe", help="Report which images carry a payload for a password, as JSON lines (fast only for tiled PNGs and raw carriers; other files are decoded in full)")
+    probe_command.add_argument("-p", "--password", required=True, help="Password to probe with")
+    probe_command.add_argument("images", nargs="+", help="Image paths")
+    batch = commands.add_parser("decode-batch", help="Decode files and directory trees with one password, as JSON lines")
+    batch.add_argument("-p", "--password", required=True, help="Password to decode with")
+    batch.add_argument("paths", nargs="+", help="Image files or directories to walk")
+    batch.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    batch.add_argument("--chunk-size", type=int, default=16, help="Files per submitted task")
+    batch.add_argument("--max-pending", type=int, default=None, help="Tasks in flight at once (default: two per worker)")
+    batch.add_argument("--legacy", action="store_true", help="Also read unversioned legacy payloads; each file without a versioned header then costs a full O(pixels) shuffle")
+    stress = commands.add_parser("stress", help="Check that concurrent encodes round-trip")
+    stress.add_argument("--jobs", type=int, default=500, help="Number of round trips")
+    stress.add_argument("--workers", type=int, default=16, help="Threads to run them on")
+    args = parser.parse_args(argv)
+    
+    if args.command == "decode-batch":
+        for record in decode_many(args.paths, args.password, args.workers, args.chunk_size, args.max_pending, args.legacy):
+            print(json.dumps(record), flush=True)
+    
+    if args.command == "stress":
+        failures = stress_test(args.jobs, args.workers)
+        for job, error in failures:
+            print(f"job {job}: {error!r}")
+        print(f"{args.jobs - len(failures)}/{args.jobs} round trips passed")
+        if failures:
+            sys.exit(1)
+    
+    if args.command == "probe":
+        for path in args.images:
+            try:
+                print(json.dumps({"path": path, "payload": probe(path, args.password)}))
+            except (OSError, ValueError) as e:
+                print(json.dumps({"path": path, "error": str(e)}))
+    
+    if args.command == "bench-scatter":
+        print(f"{'MP':>6} {'bits':>10} {'random (ms)':>12} {'sorted (ms)':>12} {'speedup':>8}")
+        for row in benchmark_scatter(args.megapixels, args.targets, args.repeat):
+            print(f"{row['megapixels']:>6g} {row['targets']:>10} {row['random_order_s'] * 1000:>12.1f} "
+                  f"{row['memory_order_s'] * 1000:>12.1f} {row['random_order_s'] / row['memory_order_s']:>7.2f}x")
+
 def show_loading_message(message):
     """Display a modal loading message during processing."""
     loading = tk.Toplevel(root)
@@ -92,49 +1466,88 @@ def choose_encode_image_action():
     if selected_encode_image_path:
         encode_image_path_label.config(text=f"Selected Image: {selected_encode_image_path}")
 
-def decode_text_from_image(password, img_path, debug=False):
-    """Decode text from an image's LSBs using the provided password."""
+def decode_text_from_image(password, img_path, debug=False, allow_legacy=True):
+    """Decode text from an image's LSBs using the provided password.
+    
+    Text payloads are returned as str and binary payloads as bytes. With allow_legacy=False only
+    versioned payloads are read, so a wrong password fails with ValueError after the header.
+    The default legacy fallback costs a full O(pixels) shuffle for every image without a
+    versioned header for password, wrong-password images included; permutation_cache only
+    spares that cost for images of a shape already decoded successfully with the same password.
+    """
     img = Image.open(img_path)
     if img.mode not in ["RGB", "RGBA"]:
         img = img.convert("RGB")
     pixels = np.array(img)
-    img_size = pixels.shape[0], pixels.shape[1]
-    pixel_positions = generate_pixel_positions(img_size, password, img_size[0] * img_size[1] * 3)
-    binary_length = ''
-    
-    for i in range(32):
-        pos = pixel_positions[i]
-        row = pos // img_size[1]
-        col = pos % img_size[1]
-        channel = i % 3
-        binary_length += str(pixels[row, col, channel] & 0x01)
-    
-    message_length = int(binary_length, 2)
-    binary_message = ''
-    
-    for i in range(32, 32 + message_length * 8):
-        pos = pixel_positions[i]
-        row = pos // img_size[1]
-        col = pos % img_size[1]
-        channel = i % 3
-        binary_message += str(pixels[row, col, channel] & 0x01)
-    
-    message = ''.join([chr(int(binary_message[i:i+8], 2)) for i in range(0, len(binary_message), 8)])
+    header, data, body_positions, body_bits = read_payload(pixels, password, allow_legacy)
+    if header.layout == LAYOUT_LEGACY:
+        message = data.decode('latin-1')
+    else:
+        message = decode_message(data, header.flags)
     
     if debug:
         # If debug mode is enabled, write the pixel-to-character mapping to the debug log file
         with open("debugLog.txt", "a") as debug_file:
             debug_file.write(f"Decoded Message: {message}\n")
             debug_file.write("Pixel -> Character Mappings:\n")
-            for i in range(32, 32 + message_length * 8):
-                pos = pixel_positions[i]
-                row = pos // img_size[1]
-                col = pos % img_size[1]
-                channel = i % 3
-                debug_file.write(f"Pixel {pos} -> Bit: {binary_message[i-32]}\n")
+            debug_file.writelines(f"Pixel {pos} -> Bit: {bit}\n" for pos, bit in zip(body_positions, body_bits))
     
     return message
 
+def iter_carrier_paths(paths):
+    """Yield image files from paths, walking directories recursively in sorted order."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories.sort()
+            for name in sorted(files):
+                if name.lower().endswith(CARRIER_EXTENSIONS):
+                    yield os.path.join(directory, name)
+
+def _decode_chunk(paths, password, allow_legacy=True):
+    records = []
+    for path in paths:
+        try:
+            message = decode_text_from_image(password, path, allow_legacy=allow_legacy)
+        except Exception as e:
+            records.append({"path": path, "status": "error", "error": f"{type(e).__name__}: {e}"})
+            continue
+        if isinstance(message, str):
+            records.append({"path": path, "status": "ok", "payload": message})
+        else:
+            records.append({"path": path, "status": "ok", "payload_base64": base64.b64encode(message).decode("ascii")})
+    return records
+
+def decode_many(paths, password, workers=None, chunk_size=16, max_pending=None, allow_legacy=False):
+    """Decode every carrier under paths on a process pool, yielding one result dict per file as it completes.
+    
+    Files are submitted in chunks of chunk_size and at most max_pending chunks (default two per
+    worker) are in flight, so memory does not grow with the number of files. Each result has
+    path and status ("ok" or "error") plus payload for text, payload_base64 for binary payloads
+    or error. Results arrive in completion order, not path order. Only versioned payloads are read
+    by default, so files without a versioned header for password fail after the header read;
+    allow_legacy=True also reads legacy payloads, at the cost of a full O(pixels) shuffle for
+    every such file.
+    """
+    if max_pending is None:
+        max_pending = (workers or os.cpu_count() or 1) * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        paths = iter(iter_carrier_paths(paths))
+        pending = set()
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(itertools.islice(paths, chunk_size))
+                if not chunk:
+                    break
+                pending.add(executor.submit(_decode_chunk, chunk, password, allow_legacy))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
 def decode_action():
     """Handle the action to decode a message from an image."""
     password = decode_password_entry.get()
@@ -145,7 +1558,7 @@ def decode_action():
     debug_mode = debug_var.get()
     try:
         message = decode_text_from_image(password, selected_decode_image_path, debug=debug_mode)
-    except IndexError:
+    except (IndexError, ValueError):
         loading_window.destroy()
         messagebox.showerror("Error", "Decoding failed: Incorrect password or corrupted image.")
         return
@@ -171,50 +1584,55 @@ def choose_decode_image_action():
     if selected_decode_image_path:
         decode_image_path_label.config(text=f"Selected Image: {selected_decode_image_path}")
 
-root = tk.Tk()
-root.title("Message Encoder/Decoder")
-notebook = ttk.Notebook(root)
-notebook.grid(row=0, column=0, padx=10, pady=10)
-encode_tab = ttk.Frame(notebook)
-notebook.add(encode_tab, text="Encode")
-
-text_label = tk.Label(encode_tab, text="Message to Encode:")
-text_label.grid(row=0, column=0, padx=10, pady=5)
-text_entry = tk.Entry(encode_tab, width=50)
-text_entry.grid(row=0, column=1, padx=10, pady=5)
-encode_password_label = tk.Label(encode_tab, text="Password:")
-encode_password_label.grid(row=1, column=0, padx=10, pady=5)
-encode_password_entry = tk.Entry(encode_tab, width=50, show="*")
-encode_password_entry.grid(row=1, column=1, padx=10, pady=5)
-debug_var = tk.BooleanVar()
-debug_checkbox = tk.Checkbutton(encode_tab, text="Debug Mode", variable=debug_var)
-debug_checkbox.grid(row=2, column=0, columnspan=2, pady=5)
-choose_image_button = tk.Button(encode_tab, text="Choose Image", command=choose_encode_image_action)
-choose_image_button.grid(row=3, column=0, columnspan=2, pady=5)
-encode_image_path_label = tk.Label(encode_tab, text="Selected Image: None")
-encode_image_path_label.grid(row=4, column=0, columnspan=2, pady=5)
-encode_button = tk.Button(encode_tab, text="Encode", command=encode_action)
-encode_button.grid(row=5, column=0, columnspan=2, pady=10)
-
-selected_encode_image_path = None
-
-decode_tab = ttk.Frame(notebook)
-notebook.add(decode_tab, text="Decode")
-
-decode_password_label = tk.Label(decode_tab, text="Password:")
-decode_password_label.grid(row=0, column=0, padx=10, pady=5)
-decode_password_entry = tk.Entry(decode_tab, width=50, show="*")
-decode_password_entry.grid(row=0, column=1, padx=10, pady=5)
-debug_var_decode = tk.BooleanVar()
-debug_checkbox_decode = tk.Checkbutton(decode_tab, text="Debug Mode", variable=debug_var_decode)
-debug_checkbox_decode.grid(row=1, column=0, columnspan=2, pady=5)
-choose_decode_image_button = tk.Button(decode_tab, text="Choose Encoded Image", command=choose_decode_image_action)
-choose_decode_image_button.grid(row=2, column=0, columnspan=2, pady=5)
-decode_image_path_label = tk.Label(decode_tab, text="Selected Image: None")
-decode_image_path_label.grid(row=3, column=0, columnspan=2, pady=5)
-decode_button = tk.Button(decode_tab, text="Decode", command=decode_action)
-decode_button.grid(row=4, column=0, columnspan=2, pady=10)
-
-selected_decode_image_path = None
-
-root.mainloop()
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_command_line(sys.argv[1:])
+        sys.exit()
+    
+    root = tk.Tk()
+    root.title("Message Encoder/Decoder")
+    notebook = ttk.Notebook(root)
+    notebook.grid(row=0, column=0, padx=10, pady=10)
+    encode_tab = ttk.Frame(notebook)
+    notebook.add(encode_tab, text="Encode")
+
+    text_label = tk.Label(encode_tab, text="Message to Encode:")
+    text_label.grid(row=0, column=0, padx=10, pady=5)
+    text_entry = tk.Entry(encode_tab, width=50)
+    text_entry.grid(row=0, column=1, padx=10, pady=5)
+    encode_password_label = tk.Label(encode_tab, text="Password:")
+    encode_password_label.grid(row=1, column=0, padx=10, pady=5)
+    encode_password_entry = tk.Entry(encode_tab, width=50, show="*")
+    encode_password_entry.grid(row=1, column=1, padx=10, pady=5)
+    debug_var = tk.BooleanVar()
+    debug_checkbox = tk.Checkbutton(encode_tab, text="Debug Mode", variable=debug_var)
+    debug_checkbox.grid(row=2, column=0, columnspan=2, pady=5)
+    choose_image_button = tk.Button(encode_tab, text="Choose Image", command=choose_encode_image_action)
+    choose_image_button.grid(row=3, column=0, columnspan=2, pady=5)
+    encode_image_path_label = tk.Label(encode_tab, text="Selected Image: None")
+    encode_image_path_label.grid(row=4, column=0, columnspan=2, pady=5)
+    encode_button = tk.Button(encode_tab, text="Encode", command=encode_action)
+    encode_button.grid(row=5, column=0, columnspan=2, pady=10)
+
+    selected_encode_image_path = None
+
+    decode_tab = ttk.Frame(notebook)
+    notebook.add(decode_tab, text="Decode")
+
+    decode_password_label = tk.Label(decode_tab, text="Password:")
+    decode_password_label.grid(row=0, column=0, padx=10, pady=5)
+    decode_password_entry = tk.Entry(decode_tab, width=50, show="*")
+    decode_password_entry.grid(row=0, column=1, padx=10, pady=5)
+    debug_var_decode = tk.BooleanVar()
+    debug_checkbox_decode = tk.Checkbutton(decode_tab, text="Debug Mode", variable=debug_var_decode)
+    debug_checkbox_decode.grid(row=1, column=0, columnspan=2, pady=5)
+    choose_decode_image_button = tk.Button(decode_tab, text="Choose Encoded Image", command=choose_decode_image_action)
+    choose_decode_image_button.grid(row=2, column=0, columnspan=2, pady=5)
+    decode_image_path_label = tk.Label(decode_tab, text="Selected Image: None")
+    decode_image_path_label.grid(row=3, column=0, columnspan=2, pady=5)
+    decode_button = tk.Button(decode_tab, text="Decode", command=decode_action)
+    decode_button.grid(row=4, column=0, columnspan=2, pady=10)
+
+    selected_decode_image_path = None
+
+    root.mainloop()